@@ -0,0 +1,51 @@
+# app/core/deadline.py
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Момент (time.monotonic), к которому запрос должен ответить; None - без дедлайна.
+# Через contextvar дедлайн доходит до gemini и поиска без лишних параметров.
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def scope(seconds: float):
+    # Вложенный дедлайн не может быть позже внешнего
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    current = _deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def check(stage: str):
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"No time left for {stage}")
+
+
+async def bounded(awaitable, stage: str):
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        awaitable.close()
+        raise DeadlineExceeded(f"No time left for {stage}")
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{stage} did not finish before the request deadline")
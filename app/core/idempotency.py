@@ -0,0 +1,234 @@
+# app/core/idempotency.py
+import asyncio
+import hashlib
+import re
+from datetime import datetime, timedelta
+
+from jose import JWTError, jwt
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+
+from ..database import async_session
+from ..models import IdempotencyKey
+from .security import SECRET_KEY, ALGORITHM
+
+# POST-эндпоинты, которые двигают деньги
+IDEMPOTENT_ROUTES = [
+    re.compile(r"^/tasks/\d+/approve$"),
+    re.compile(r"^/loans/\d+/approve$"),
+    re.compile(r"^/loans/\d+/repay$"),
+    # Повтор после таймаута иначе поставит второе задание и заплатит дважды
+    re.compile(r"^/jobs/payouts$"),
+]
+
+KEY_TTL = timedelta(hours=24)
+# Если воркер упал посреди запроса, ключ не должен висеть вечно
+PENDING_TIMEOUT = timedelta(seconds=60)
+WAIT_TIMEOUT = 10.0
+POLL_INTERVAL = 0.05
+PURGE_INTERVAL = timedelta(minutes=10)
+
+
+def _owner(headers: Headers) -> str | None:
+    auth = headers.get("authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    try:
+        payload = jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+def _fingerprint(scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(scope["method"].encode())
+    digest.update(scope["path"].encode())
+    digest.update(scope.get("query_string", b""))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    body = b"".join(chunks)
+
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def _replay(record: IdempotencyKey) -> Response:
+    return Response(
+        content=record.response_body or "",
+        status_code=record.status_code,
+        media_type=record.content_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._inflight: dict[tuple[str, str], asyncio.Event] = {}
+        self._last_purge = datetime.utcnow()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not any(p.match(scope["path"]) for p in IDEMPOTENT_ROUTES)
+        ):
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        key = headers.get("idempotency-key")
+        owner = _owner(headers)
+        # Без ключа или без валидного токена работаем как обычно (401 отдаст сам роутер)
+        if not key or owner is None:
+            return await self.app(scope, receive, send)
+
+        if len(key) > 255:
+            response = JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)
+            return await response(scope, receive, send)
+
+        body, receive = await _read_body(receive)
+        fingerprint = _fingerprint(scope, body)
+
+        response = await self._claim(owner, key, fingerprint)
+        if response is not None:
+            return await response(scope, receive, send)
+
+        event = asyncio.Event()
+        self._inflight[(owner, key)] = event
+
+        captured = {"status": 500, "content_type": None, "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["content_type"] = Headers(raw=message["headers"]).get("content-type")
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            try:
+                await self._finish(owner, key, captured)
+            finally:
+                del self._inflight[(owner, key)]
+                event.set()
+
+        await self._maybe_purge()
+
+    async def _claim(self, owner: str, key: str, fingerprint: str) -> Response | None:
+        # None -> ключ наш, выполняем запрос. Иначе готовый ответ клиенту.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WAIT_TIMEOUT
+
+        while True:
+            record = await self._reserve(owner, key, fingerprint)
+            if record is None:
+                return None
+
+            if record.fingerprint != fingerprint:
+                return JSONResponse(
+                    {"detail": "Idempotency-Key was already used with a different request"},
+                    status_code=422,
+                )
+
+            if record.status_code is not None:
+                return _replay(record)
+
+            # Первый запрос ещё выполняется: ждём его, а не делаем работу второй раз
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still being processed"},
+                    status_code=409,
+                    headers={"Retry-After": "1"},
+                )
+
+            event = self._inflight.get((owner, key))
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Запрос выполняет другой воркер
+                await asyncio.sleep(min(POLL_INTERVAL, remaining))
+
+    async def _reserve(self, owner: str, key: str, fingerprint: str) -> IdempotencyKey | None:
+        while True:
+            now = datetime.utcnow()
+            async with async_session() as session:
+                stmt = (
+                    insert(IdempotencyKey)
+                    .values(
+                        key=key,
+                        owner=owner,
+                        fingerprint=fingerprint,
+                        created_at=now,
+                        expires_at=now + KEY_TTL,
+                    )
+                    .on_conflict_do_nothing()
+                    .returning(IdempotencyKey.key)
+                )
+                inserted = (await session.exec(stmt)).first()
+                await session.commit()
+                if inserted is not None:
+                    return None
+
+                record = await session.get(IdempotencyKey, (key, owner))
+                if record is None:
+                    continue
+
+                abandoned = record.status_code is None and record.created_at < now - PENDING_TIMEOUT
+                if record.expires_at < now or abandoned:
+                    await session.delete(record)
+                    await session.commit()
+                    continue
+
+                return record
+
+    async def _finish(self, owner: str, key: str, captured: dict):
+        async with async_session() as session:
+            record = await session.get(IdempotencyKey, (key, owner))
+            if record is None:
+                return
+
+            # 5xx не запоминаем, чтобы клиент мог честно повторить
+            if captured["status"] >= 500:
+                await session.delete(record)
+            else:
+                record.status_code = captured["status"]
+                record.content_type = captured["content_type"]
+                record.response_body = b"".join(captured["body"]).decode("utf-8", errors="replace")
+                session.add(record)
+            await session.commit()
+
+    async def _maybe_purge(self):
+        now = datetime.utcnow()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        async with async_session() as session:
+            await session.exec(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+            await session.commit()
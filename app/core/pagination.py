@@ -0,0 +1,46 @@
+# app/core/pagination.py
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException, Response
+from sqlalchemy import bindparam, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def status_in(column, statuses):
+    # Статусы подставляются литералами, а не параметрами: иначе планировщик
+    # на подготовленном запросе не докажет условие частичного индекса
+    return column.in_(bindparam(f"{column.key}_in", list(statuses), expanding=True, literal_execute=True))
+
+
+def keyset_page(stmt, created_at_column, id_column, cursor: str | None, limit: int):
+    # Новые сверху; курсор - (created_at, id) последней отданной строки
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(created_at_column, id_column) < tuple_(created_at, row_id))
+    return stmt.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def finish_page(rows: list, limit: int, response: Response) -> list:
+    # Следующая страница есть, если вернулось на одну строку больше лимита
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    return rows
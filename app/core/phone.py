@@ -0,0 +1,20 @@
+# app/core/phone.py
+# Один формат номера для регистрации, логина и ключей rate limit:
+# "+996" и 9 цифр. Иначе "0555 123 456" и "+996555123456" - разные бакеты
+# для одного аккаунта.
+
+def normalize_phone(v: str) -> str:
+    clean_number = v.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+    if clean_number.startswith("+996"):
+        clean_number = clean_number[4:]
+
+    if not clean_number.isdigit():
+        raise ValueError('Номер должен содержать только цифры')
+
+    if len(clean_number) == 10 and clean_number.startswith("0"):
+        clean_number = clean_number[1:]
+
+    if len(clean_number) != 9:
+        raise ValueError('Номер должен состоять из 9 цифр (код оператора + номер). Например: 555123456')
+
+    return f"+996{clean_number}"
@@ -0,0 +1,241 @@
+# app/core/ratelimit.py
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+
+from .phone import normalize_phone
+from .security import SECRET_KEY, ALGORITHM
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# Если задан, бакеты живут в Redis и лимиты общие для всех воркеров
+REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Нагрузочные тесты гоняют всё с одного IP, там бакеты выключаются
+BUCKETS_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+
+MAX_BUCKETS = 100_000
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    ip_rate: float          # токенов в секунду
+    ip_burst: int
+    principal_rate: float
+    principal_burst: int
+    max_concurrency: int    # одновременно выполняемых запросов на воркер
+    max_queue: int          # сколько запросов может ждать слот
+    max_wait: float         # бюджет ожидания в очереди, секунды
+
+
+ROUTE_LIMITS = {
+    # bcrypt съедает ~250мс CPU на попытку
+    "login": RouteLimit(
+        ip_rate=1.0, ip_burst=10,
+        principal_rate=0.2, principal_burst=5,
+        max_concurrency=int(os.getenv("LOGIN_MAX_CONCURRENCY", "4")),
+        max_queue=16,
+        max_wait=1.0,
+    ),
+    # без авторизации, до 8 bcrypt-хэшей на запрос
+    "onboarding": RouteLimit(
+        ip_rate=0.05, ip_burst=5,
+        principal_rate=0.05, principal_burst=5,
+        max_concurrency=int(os.getenv("ONBOARDING_MAX_CONCURRENCY", "2")),
+        max_queue=8,
+        max_wait=2.0,
+    ),
+    # ограничено квотой Gemini
+    "ask": RouteLimit(
+        ip_rate=0.5, ip_burst=5,
+        principal_rate=0.2, principal_burst=3,
+        max_concurrency=int(os.getenv("ASK_MAX_CONCURRENCY", "8")),
+        max_queue=16,
+        max_wait=2.0,
+    ),
+}
+
+
+class MemoryBucketStore:
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        # 0 -> токен списан, иначе сколько секунд ждать следующего
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+
+        if tokens >= 1.0:
+            self._buckets[key] = (tokens - 1.0, now)
+            retry_after = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            retry_after = (1.0 - tokens) / rate
+
+        if len(self._buckets) > MAX_BUCKETS:
+            self._prune(now)
+        return retry_after
+
+    def _prune(self, now: float):
+        # Полный бакет ничем не отличается от отсутствующего
+        stale = [k for k, (_, updated) in self._buckets.items() if now - updated > 3600]
+        for k in stale:
+            del self._buckets[k]
+        if len(self._buckets) > MAX_BUCKETS:
+            self._buckets.clear()
+
+
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisBucketStore:
+    def __init__(self, url: str):
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        result = await self._script(keys=[f"rl:{key}"], args=[rate, burst, time.time()])
+        return float(result)
+
+
+if REDIS_URL:
+    # Молча откатиться на память нельзя: у каждого воркера были бы свои
+    # бакеты, и лимит вырос бы в число воркеров раз
+    if aioredis is None:
+        raise RuntimeError("RATE_LIMIT_REDIS_URL is set, but the redis package is not installed")
+    bucket_store = RedisBucketStore(REDIS_URL)
+else:
+    bucket_store = MemoryBucketStore()
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, max_queue: int, max_wait: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise _overloaded(self.max_wait)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            raise _overloaded(self.max_wait)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+
+limiters = {
+    name: ConcurrencyLimiter(limit.max_concurrency, limit.max_queue, limit.max_wait)
+    for name, limit in ROUTE_LIMITS.items()
+}
+
+
+def _overloaded(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, try again later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _too_many(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+async def _principal(request: Request, route_class: str) -> str | None:
+    if route_class == "login":
+        # Форма уже распарсена к этому моменту, Starlette кэширует её на запросе
+        form = await request.form()
+        username = form.get("username")
+        if not username:
+            return None
+        # Ключ - тот же номер, по которому login ищет аккаунт, иначе смена
+        # записи ("0555...", "+996 555...") даёт новый бакет
+        try:
+            return f"phone:{normalize_phone(username)}"
+        except ValueError:
+            return f"phone:{username}"
+
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    try:
+        payload = jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    sub = payload.get("sub")
+    return f"user:{sub}" if sub else None
+
+
+async def _check_buckets(request: Request, route_class: str, limit: RouteLimit):
+    retry_after = await bucket_store.take(
+        f"{route_class}:ip:{client_ip(request)}", limit.ip_rate, limit.ip_burst
+    )
+    if retry_after:
+        raise _too_many(retry_after)
+
+    principal = await _principal(request, route_class)
+    if principal is not None:
+        retry_after = await bucket_store.take(
+            f"{route_class}:{principal}", limit.principal_rate, limit.principal_burst
+        )
+        if retry_after:
+            raise _too_many(retry_after)
+
+
+def admit(route_class: str):
+    limit = ROUTE_LIMITS[route_class]
+    limiter = limiters[route_class]
+
+    async def dependency(request: Request):
+        if BUCKETS_ENABLED:
+            await _check_buckets(request, route_class, limit)
+
+        await limiter.acquire()
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    return dependency
@@ -1,20 +1,42 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+from .timing import timed
+
 SECRET_KEY = "lorap_iytslot_onhcot_ote_hahs_dna_reeeehsila"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt отпускает GIL, поэтому пачку хэшей считаем параллельно на всех ядрах.
+# Свой пул, чтобы массовая регистрация не занимала общий to_thread.
+HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="bcrypt")
+
+@timed("verify_password")
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+async def check_password(plain_password, hashed_password) -> bool:
+    # ~250мс CPU: на event loop это стоп для всех запросов воркера.
+    # Контекст копируем, чтобы фаза verify_password попала в тайминги запроса
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(HASH_POOL, ctx.run, verify_password, plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(HASH_POOL, get_password_hash, p) for p in passwords))
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
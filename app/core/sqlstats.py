@@ -0,0 +1,153 @@
+# app/core/sqlstats.py
+import contextvars
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# off - только считаем, warn - пишем отчёт в лог, raise - роняем запрос (для тестов)
+MODE = os.getenv("SQL_BUDGET_MODE", "warn")
+
+# Одинаковый запрос столько раз за запрос - почти наверняка N+1
+REPEAT_THRESHOLD = 3
+
+# Сколько SQL-запросов разрешено эндпоинту, включая get_current_user.
+# Денежные эндпоинты - с учётом резервирования Idempotency-Key.
+SQL_BUDGETS = {
+    "POST /auth/register": 4,
+    "POST /auth/login": 1,
+    "GET /users/me": 1,
+    "GET /users/family": 2,
+    "POST /families/add-child": 3,
+    "POST /onboarding/family": 3,
+    "POST /onboarding/batch": 5,
+    "GET /families/me": 2,
+    "POST /tasks/": 4,
+    "GET /tasks/": 2,
+    "GET /tasks/counts": 2,
+    "POST /tasks/{task_id}/submit": 2,
+    "POST /tasks/{task_id}/approve": 8,
+    "POST /tasks/{task_id}/reject": 2,
+    "POST /loans/": 3,
+    "GET /loans/": 2,
+    "GET /loans/counts": 2,
+    "POST /loans/{loan_id}/approve": 9,
+    "POST /loans/{loan_id}/repay": 8,
+    "POST /loans/{loan_id}/reject": 2,
+    "GET /analytics/children/{child_id}": 3,
+    "GET /exports/transactions": 2,
+    "POST /jobs/": 1,
+    "GET /jobs/{job_id}": 1,
+    "POST /jobs/payouts": 4,
+    "GET /jobs/payouts/{job_id}": 2,
+}
+
+_PLACEHOLDER_LIST = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class SQLBudgetExceeded(AssertionError):
+    pass
+
+
+class StatementStats:
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.db_time += seconds
+        self.shapes[shape(statement)] += 1
+
+    def repeated(self) -> list[tuple[str, int]]:
+        return [(s, n) for s, n in self.shapes.most_common() if n >= REPEAT_THRESHOLD]
+
+    def report(self, label: str, budget: int | None = None) -> str:
+        header = f"{label}: {self.count} statements"
+        if budget is not None:
+            header += f" (budget {budget})"
+        header += f", {self.db_time * 1000:.1f} ms in DB"
+        lines = [header]
+        for statement, n in self.shapes.most_common():
+            marker = "  <- repeated" if n >= REPEAT_THRESHOLD else ""
+            lines.append(f"  {n}x {statement[:200]}{marker}")
+        return "\n".join(lines)
+
+
+_stats: contextvars.ContextVar[StatementStats | None] = contextvars.ContextVar("sql_stats", default=None)
+
+
+def shape(statement: str) -> str:
+    # IN ($1, $2, ...) разной длины - это один и тот же запрос
+    return _PLACEHOLDER_LIST.sub("?", _WHITESPACE.sub(" ", statement).strip())
+
+
+def record_statement(statement: str, seconds: float):
+    stats = _stats.get()
+    if stats is not None:
+        stats.add(statement, seconds)
+
+
+@contextmanager
+def track():
+    # Для тестов и скриптов: with track() as stats: ...; stats.count
+    stats = StatementStats()
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+@contextmanager
+def assert_max_statements(limit: int, label: str = "block"):
+    with track() as stats:
+        yield stats
+    if stats.count > limit or stats.repeated():
+        raise SQLBudgetExceeded(stats.report(label, limit))
+
+
+class SQLStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = StatementStats()
+        token = _stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-statements", str(stats.count).encode())
+                ]
+                if MODE != "off":
+                    self._check(scope, stats)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _stats.reset(token)
+
+    def _check(self, scope, stats: StatementStats):
+        route = getattr(scope.get("route"), "path", None)
+        if route is None:
+            return
+        endpoint = f"{scope['method']} {route}"
+        budget = SQL_BUDGETS.get(endpoint)
+
+        if (budget is None or stats.count <= budget) and not stats.repeated():
+            return
+
+        report = stats.report(endpoint, budget)
+        if MODE == "raise":
+            raise SQLBudgetExceeded(report)
+        logger.warning("SQL budget exceeded\n%s", report)
@@ -0,0 +1,157 @@
+# app/core/timing.py
+import contextvars
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Фазы текущего запроса: имя -> суммарное время в секундах.
+# В threadpool контекст копируется, но словарь тот же, поэтому
+# фазы из синхронных эндпоинтов тоже попадают сюда.
+_phases: contextvars.ContextVar[dict | None] = contextvars.ContextVar("timing_phases", default=None)
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def record(name: str, seconds: float):
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with phase(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # labels -> [счётчики по бакетам (+Inf последним), сумма, количество]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        series[0][bisect_left(BUCKETS, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, c in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_str},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_str}}} {total}")
+            lines.append(f"{self.name}_count{{{label_str}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._series: dict[tuple, int] = {}
+
+    def inc(self, labels: tuple, value: int = 1):
+        self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, count in sorted(self._series.items()):
+            label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{label_str}}} {count}")
+        return lines
+
+
+request_duration = Histogram(
+    "balabank_request_duration_seconds",
+    "HTTP request latency",
+    ("method", "route", "status"),
+)
+phase_duration = Histogram(
+    "balabank_phase_duration_seconds",
+    "Time spent per request phase (db, verify_password, embed, search, llm)",
+    ("route", "phase"),
+)
+
+
+# Доля деградаций: всё, что не outcome="full"
+ask_answers = Counter(
+    "balabank_ask_answers_total",
+    "Answers from /ask by outcome (full, cache, chunks, none) and degradation reason",
+    ("role", "outcome", "reason"),
+)
+
+
+def render_metrics() -> str:
+    lines = request_duration.render() + phase_duration.render() + ask_answers.render()
+    return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        phases = {}
+        token = _phases.set(phases)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = time.perf_counter() - started
+                entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items()]
+                entries.append(f"total;dur={total * 1000:.1f}")
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", ", ".join(entries).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _phases.reset(token)
+            elapsed = time.perf_counter() - started
+            # Шаблон пути, а не сам путь, чтобы id не раздували число серий
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe((scope["method"], route, str(status)), elapsed)
+            for name, seconds in phases.items():
+                phase_duration.observe((route, name), seconds)
@@ -1,17 +1,30 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from sqlmodel import SQLModel
 
-from app.routers import users, auth, family, tasks, loans, ask
+from app.routers import users, auth, family, tasks, loans, ask, monitoring, analytics, exports, onboarding, jobs
 from app.database import engine
+from app.migrations import prepare_schema
+from app.services import gemini, search
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.timing import TimingMiddleware
+from app.core.sqlstats import SQLStatsMiddleware
 
 from fastapi.middleware.cors import CORSMiddleware
 
+async def warm_up_ask():
+    await search.load_in_background()
+    if gemini.api_key:
+        await asyncio.to_thread(gemini.get_client)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+    await prepare_schema(engine)
+    # Индекс и Gemini для /ask поднимаются в фоне, остальной API отвечает сразу
+    warmup = asyncio.create_task(warm_up_ask())
     yield
+    warmup.cancel()
 
 app = FastAPI(
     title="BalaBank API",
@@ -22,6 +35,10 @@ origins = [
     "*",                          
 ]
 
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(SQLStatsMiddleware)
+app.add_middleware(TimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,        
@@ -33,9 +50,14 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(family.router)
+app.include_router(onboarding.router)
 app.include_router(tasks.router)
 app.include_router(loans.router)
+app.include_router(analytics.router)
+app.include_router(exports.router)
+app.include_router(jobs.router)
 app.include_router(ask.router)
+app.include_router(monitoring.router)
 
 
 
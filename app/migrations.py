@@ -0,0 +1,121 @@
+# Схему создаёт SQLModel.metadata.create_all, но он не трогает уже
+# существующие таблицы. Изменения существующих таблиц - здесь: каждая миграция
+# выполняется один раз и записывается в schema_migration.
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint, CreateTable
+from sqlmodel import SQLModel
+
+from app.models import Loan, Task, Transaction, create_family_partitions
+from app.services import rollups
+
+
+def _loan_family_id(conn):
+    conn.execute(text("ALTER TABLE loan ADD COLUMN IF NOT EXISTS family_id INTEGER REFERENCES family (id)"))
+    conn.execute(text(
+        'UPDATE loan SET family_id = "user".family_id FROM "user" '
+        "WHERE loan.borrower_id = \"user\".id AND loan.family_id IS NULL"
+    ))
+
+
+def _daily_rollups(conn):
+    # На старой базе transaction.family_id появится только в 0003
+    rollups.rebuild(conn, by_family=False)
+
+
+# Откуда взять family_id для строк старой таблицы
+FAMILY_SOURCES = {
+    Task.__table__: ('LEFT JOIN "user" c ON c.id = old.child_id', "c.family_id"),
+    Transaction.__table__: (
+        'LEFT JOIN "user" s ON s.id = old.sender_id LEFT JOIN "user" r ON r.id = old.receiver_id',
+        "COALESCE(s.family_id, r.family_id)",
+    ),
+    Loan.__table__: ('LEFT JOIN "user" b ON b.id = old.borrower_id', "COALESCE(old.family_id, b.family_id)"),
+}
+
+
+def _partition_by_family(conn):
+    # Обычную таблицу в секционированную не превратить: создаём новую рядом,
+    # переливаем строки с family_id и удаляем старую. В новой базе create_all
+    # уже создал секционированные таблицы - их пропускаем.
+    for table, (join, family_id) in FAMILY_SOURCES.items():
+        name = table.name
+        relkind = conn.execute(
+            text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:name)"), {"name": f'"{name}"'}
+        ).scalar()
+        if relkind != "r":
+            continue
+
+        old = f"{name}_unpartitioned"
+        conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{old}"'))
+        # Имена первичного ключа, последовательности и индексов заняты старой таблицей
+        conn.execute(text(f'ALTER INDEX IF EXISTS "{name}_pkey" RENAME TO "{old}_pkey"'))
+        conn.execute(text(f'ALTER SEQUENCE IF EXISTS "{name}_id_seq" RENAME TO "{old}_id_seq"'))
+        for index in table.indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+
+        # Как в seed.py: индексы (в конце run_migrations) и ключи - после заливки
+        conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+        create_family_partitions(table, conn)
+        columns = ", ".join(f'"{c.name}"' for c in table.columns if c.name != "family_id")
+        old_columns = ", ".join(f'old."{c.name}"' for c in table.columns if c.name != "family_id")
+        conn.execute(text(
+            f'INSERT INTO "{name}" ({columns}, family_id) '
+            f'SELECT {old_columns}, {family_id} FROM "{old}" old {join}'
+        ))
+        conn.execute(text(f'DROP TABLE "{old}"'))
+        for constraint in table.foreign_key_constraints:
+            conn.execute(AddConstraint(constraint))
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{name}\"', 'id'), "
+            f'GREATEST(MAX(id), 1), MAX(id) IS NOT NULL) FROM "{name}"'
+        ))
+        conn.execute(text(f'ANALYZE "{name}"'))
+
+
+MIGRATIONS = [
+    ("0001_loan_family_id", _loan_family_id),
+    ("0002_daily_rollups", _daily_rollups),
+    ("0003_family_partitions", _partition_by_family),
+]
+
+
+def _create_migration_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migration ("
+        "name VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+
+
+def mark_all_applied(conn):
+    # Для seed.py: он сам строит схему в её текущем виде и пересчитывает
+    # итоги, миграциям при старте API делать нечего
+    _create_migration_table(conn)
+    for name, _ in MIGRATIONS:
+        conn.execute(
+            text("INSERT INTO schema_migration (name) VALUES (:name) ON CONFLICT (name) DO NOTHING"), {"name": name}
+        )
+
+
+def run_migrations(conn):
+    _create_migration_table(conn)
+    applied = set(conn.execute(text("SELECT name FROM schema_migration")).scalars())
+
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        migrate(conn)
+        conn.execute(text("INSERT INTO schema_migration (name) VALUES (:name)"), {"name": name})
+
+    # Индексы, объявленные в моделях позже создания таблиц
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def prepare_schema(engine):
+    # Из lifespan API и из воркера заданий: кто стартовал первым, тот и создаёт
+    async with engine.begin() as conn:
+        # Процессы стартуют одновременно, create_all выполняем по очереди
+        await conn.execute(text("SELECT pg_advisory_xact_lock(7355608)"))
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(run_migrations)
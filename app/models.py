@@ -1,9 +1,10 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
 from enum import Enum
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from sqlalchemy import Column, Numeric
+from sqlalchemy import Column, Index, Numeric, event, text
+from sqlalchemy.dialects.postgresql import JSONB
 
 class UserRole(str, Enum):
     PARENT = "parent"
@@ -21,6 +22,12 @@ class LoanStatus(str, Enum):
     PAID = "paid"
     REJECTED = "rejected"
     
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 class RequestStatus(str, Enum):
     PENDING = "pending"
     APPROVED = "approved"
@@ -73,8 +80,36 @@ class User(SQLModel, table=True):
         sa_relationship_kwargs={"foreign_keys": "Loan.lender_id"}
     )
 
+# Живые статусы: то, что реально открывают в приложении. Частичные индексы
+# по ним остаются маленькими, сколько бы ни накопилось истории.
+LIVE_TASKS = text("status IN ('NEW', 'WAITING_APPROVAL')")
+LIVE_LOANS = text("status IN ('REQUESTED', 'ACTIVE')")
+
+# Задачи, займы и переводы секционированы по hash(family_id): почти все
+# запросы - про одну семью и с условием на family_id читают одну секцию из
+# FAMILY_PARTITIONS. Ключ секционирования обязан входить в первичный ключ,
+# поэтому он (id, family_id). Число секций меняется только пересозданием таблиц.
+FAMILY_PARTITIONS = 16
+PARTITION_BY_FAMILY = {"postgresql_partition_by": "HASH (family_id)"}
+
+def create_family_partitions(table, connection, **kw):
+    for remainder in range(FAMILY_PARTITIONS):
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{table.name}_p{remainder}" PARTITION OF "{table.name}" '
+            f"FOR VALUES WITH (MODULUS {FAMILY_PARTITIONS}, REMAINDER {remainder})"
+        ))
+
 class Task(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+    __table_args__ = (
+        Index("ix_task_creator_created", "creator_id", "created_at", "id"),
+        Index("ix_task_child_created", "child_id", "created_at", "id"),
+        Index("ix_task_creator_live", "creator_id", "created_at", "id", postgresql_where=LIVE_TASKS),
+        Index("ix_task_child_live", "child_id", "created_at", "id", postgresql_where=LIVE_TASKS),
+        PARTITION_BY_FAMILY,
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    family_id: int = Field(foreign_key="family.id", primary_key=True)
     title: str
     description: Optional[str] = None
     
@@ -88,7 +123,17 @@ class Task(SQLModel, table=True):
     creator_id: int 
 
 class Transaction(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+    __table_args__ = (
+        Index("ix_transaction_sender_timestamp", "sender_id", "timestamp"),
+        Index("ix_transaction_receiver_timestamp", "receiver_id", "timestamp"),
+        # Выгрузка всей семьи
+        Index("ix_transaction_family_timestamp", "family_id", "timestamp", "id"),
+        PARTITION_BY_FAMILY,
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    # Переводы только внутри семьи: отправитель и получатель из неё
+    family_id: int = Field(foreign_key="family.id", primary_key=True)
     
     amount: Decimal = Field(sa_column=Column(Numeric(10, 2)))
     
@@ -98,7 +143,15 @@ class Transaction(SQLModel, table=True):
     receiver_id: int
 
 class Loan(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+    __table_args__ = (
+        Index("ix_loan_family_created", "family_id", "created_at", "id"),
+        Index("ix_loan_borrower_created", "borrower_id", "created_at", "id"),
+        Index("ix_loan_family_live", "family_id", "created_at", "id", postgresql_where=LIVE_LOANS),
+        Index("ix_loan_borrower_live", "borrower_id", "created_at", "id", postgresql_where=LIVE_LOANS),
+        PARTITION_BY_FAMILY,
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
     
     amount: Decimal = Field(sa_column=Column(Numeric(10, 2)))
     interest_rate: Decimal = Field(sa_column=Column(Numeric(5, 2))) 
@@ -116,7 +169,66 @@ class Loan(SQLModel, table=True):
     )
 
     lender_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    # Семья заёмщика: список займов семьи без join с user
+    family_id: int = Field(foreign_key="family.id", primary_key=True)
     lender: Optional[User] = Relationship(
         back_populates="lent_loans",
         sa_relationship_kwargs={"foreign_keys": "[Loan.lender_id]"}
-    )
\ No newline at end of file
+    )
+
+for model in (Task, Transaction, Loan):
+    event.listen(model.__table__, "after_create", create_family_partitions)
+
+class DailyRollup(SQLModel, table=True):
+    # Дневные суммы по пользователю; пополняются вместе с каждой Transaction
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    
+    inflow: Decimal = Field(default=Decimal("0.00"), sa_column=Column(Numeric(12, 2), nullable=False))
+    outflow: Decimal = Field(default=Decimal("0.00"), sa_column=Column(Numeric(12, 2), nullable=False))
+    task_rewards: Decimal = Field(default=Decimal("0.00"), sa_column=Column(Numeric(12, 2), nullable=False))
+    # Получено в долг и переплачено процентами - со стороны заёмщика
+    loan_principal: Decimal = Field(default=Decimal("0.00"), sa_column=Column(Numeric(12, 2), nullable=False))
+    loan_interest: Decimal = Field(default=Decimal("0.00"), sa_column=Column(Numeric(12, 2), nullable=False))
+
+class IdempotencyKey(SQLModel, table=True):
+    key: str = Field(primary_key=True, max_length=255)
+    owner: str = Field(primary_key=True)
+    fingerprint: str
+    
+    # None, пока первый запрос ещё выполняется
+    status_code: Optional[int] = Field(default=None)
+    content_type: Optional[str] = Field(default=None)
+    response_body: Optional[str] = Field(default=None)
+    
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+class Job(SQLModel, table=True):
+    # Фоновые задания (app/services/jobs.py, воркер - python -m app.worker)
+    __table_args__ = (
+        # Очередь в порядке выборки; выполненные задания в индекс не попадают
+        Index("ix_job_queue", text("priority DESC"), "run_at", "id", postgresql_where=text("status = 'QUEUED'")),
+        Index("ix_job_running", "heartbeat_at", postgresql_where=text("status = 'RUNNING'")),
+        Index("ix_job_created_by", "created_by", "created_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    type: str = Field(max_length=64)
+    payload: dict = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False))
+    status: JobStatus = Field(default=JobStatus.QUEUED)
+    # Больше - раньше
+    priority: int = Field(default=0)
+    
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=5)
+    # Не раньше этого момента; при повторе сдвигается на время backoff
+    run_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_by: Optional[int] = Field(default=None, foreign_key="user.id")
+    
+    locked_by: Optional[str] = Field(default=None)
+    heartbeat_at: Optional[datetime] = Field(default=None)
+    finished_at: Optional[datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSONB))
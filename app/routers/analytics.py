@@ -0,0 +1,94 @@
+# app/routers/analytics.py
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import get_session
+from app.models import DailyRollup, User, UserRole
+from app.core.deps import get_current_user
+from app.core.timing import phase
+from app.services.rollups import AMOUNTS
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+def _moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    # Скользящее среднее за window дней, считая текущий; в начале ряда окно короче
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    end = np.arange(1, len(values) + 1)
+    begin = np.maximum(end - window, 0)
+    return (csum[end] - csum[begin]) / (end - begin)
+
+
+def _change(current: float, previous: float):
+    if previous == 0:
+        return None
+    return round((current - previous) / previous * 100, 1)
+
+
+def _rounded(values: np.ndarray) -> list:
+    return np.round(values, 2).tolist()
+
+
+@router.get("/children/{child_id}")
+async def child_analytics(
+    child_id: int,
+    days: int = Query(30, ge=1, le=365),
+    window: int = Query(7, ge=1, le=90),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    if current_user.id == child_id:
+        child = current_user
+    else:
+        child = await session.get(User, child_id)
+        if not child or child.family_id != current_user.family_id or current_user.role != UserRole.PARENT:
+            raise HTTPException(status_code=403, detail="This is not your family member!")
+    if child.role != UserRole.CHILD:
+        raise HTTPException(status_code=400, detail="Analytics is available for children only")
+
+    # Текущий период и предыдущий такой же длины - для сравнения и разгона среднего
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=2 * days - 1)
+    stmt = (
+        select(DailyRollup.day, *(getattr(DailyRollup, name) for name in AMOUNTS))
+        .where(DailyRollup.user_id == child.id, DailyRollup.day >= start)
+    )
+    rows = (await session.exec(stmt)).all()
+
+    with phase("analytics"):
+        series = np.zeros((len(AMOUNTS), 2 * days))
+        if rows:
+            offsets = np.array([(row[0] - start).days for row in rows])
+            series[:, offsets] = np.array([row[1:] for row in rows], dtype=float).T
+        values = dict(zip(AMOUNTS, series))
+        net = values["inflow"] - values["outflow"]
+
+        # Баланс на конец каждого дня: от текущего назад вычитаем более поздние дни
+        later = np.cumsum(net[::-1])[::-1] - net
+        balance = float(child.balance) - later
+
+        current = slice(days, None)
+        previous = slice(None, days)
+        totals = {}
+        for name, column in [*values.items(), ("net", net)]:
+            now, before = float(column[current].sum()), float(column[previous].sum())
+            totals[name] = {"current": round(now, 2), "previous": round(before, 2), "change_pct": _change(now, before)}
+
+    return {
+        "child_id": child.id,
+        "days": [(start + timedelta(days=i)).isoformat() for i in range(days, 2 * days)],
+        "window": window,
+        "series": {
+            **{name: _rounded(column[current]) for name, column in values.items()},
+            "net": _rounded(net[current]),
+            "net_avg": _rounded(_moving_average(net, window)[current]),
+            "inflow_avg": _rounded(_moving_average(values["inflow"], window)[current]),
+            "outflow_avg": _rounded(_moving_average(values["outflow"], window)[current]),
+            "balance": _rounded(balance[current]),
+        },
+        "totals": totals,
+    }
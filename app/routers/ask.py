@@ -1,11 +1,25 @@
-from fastapi import APIRouter, HTTPException
+import logging
+import os
+
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from app.services import search 
+from app.services import answer_cache, search
 from app.services.llm import ask_llm
+from app.services.gemini import UpstreamError, UpstreamTimeout, UpstreamUnavailable
+from app.core import deadline, timing
+from app.core.ratelimit import admit
+
+logger = logging.getLogger(__name__)
+
+# Бюджет на эмбеддинг, поиск и LLM вместе; ожидание в очереди admit сюда не входит
+ASK_DEADLINE = float(os.getenv("ASK_DEADLINE", "8"))
+FALLBACK_CHUNKS = 3
+FALLBACK_CHUNK_CHARS = 600
 
 router = APIRouter(
     prefix="/ask",
-    tags=["ask"]
+    tags=["ask"],
+    dependencies=[Depends(admit("ask"))]
 )
 
 class AskRequest(BaseModel):
@@ -13,39 +27,81 @@ class AskRequest(BaseModel):
 
 class AskResponse(BaseModel):
     llm_answer: str | None = None
+    # degraded - LLM не ответила вовремя; fallback: cache - прошлый ответ на тот же
+    # вопрос, chunks - найденные фрагменты без пересказа, none - отдать нечего
+    degraded: bool = False
+    fallback: str | None = None
+    reason: str | None = None
+    chunks: list[str] = []
+
+UNAVAILABLE_ANSWER = {
+    "children": "Я сейчас не успеваю ответить. Попробуй спросить ещё раз чуть позже!",
+    "parent": "Сервис ответов сейчас перегружен. Повторите вопрос через минуту.",
+}
 
 ROLE_PROMPTS = {
     "children": "Ты помощник для детей. Объясняй всё простыми, дружелюбными словами. Вот контекст, на который можешь опираться, но не обязан:",
     "parent": "Ты помощник для взрослых. Отвечай строго, по сути, с аргументами. Вот контекст, на который можешь опираться, но не обязан:"
 }
 
-def generate_role_answer(role: str, query: str, top_k: int = 5):
-    context_chunks = search.search(query, top_k=top_k)
+def build_prompt(role: str, query: str, context_chunks: list[dict]) -> str:
     context_text = "\n\n".join([c["text"] for c in context_chunks])
-
-    prompt = (
+    return (
         f"{ROLE_PROMPTS[role]}\n\n"
         f"Контекст:\n{context_text}\n\n"
         f"Вопрос: {query}\nОтвет:"
     )
 
-    llm_answer = ask_llm(prompt)
-    return llm_answer
+
+def _reason(e: Exception) -> str:
+    if isinstance(e, deadline.DeadlineExceeded):
+        return "deadline"
+    if isinstance(e, search.SearchNotReady):
+        return "index_not_ready"
+    if isinstance(e, UpstreamUnavailable):
+        return "upstream_unavailable"
+    if isinstance(e, UpstreamTimeout):
+        return "upstream_timeout"
+    if isinstance(e, UpstreamError):
+        return "upstream_error"
+    return "error"
+
+
+def degraded_answer(role: str, query: str, context_chunks: list[dict], reason: str) -> AskResponse:
+    cached = answer_cache.get(role, query)
+    if cached is not None:
+        outcome = AskResponse(llm_answer=cached, degraded=True, fallback="cache", reason=reason)
+    elif context_chunks:
+        texts = [c["text"][:FALLBACK_CHUNK_CHARS] for c in context_chunks[:FALLBACK_CHUNKS]]
+        outcome = AskResponse(degraded=True, fallback="chunks", reason=reason, chunks=texts)
+    else:
+        outcome = AskResponse(llm_answer=UNAVAILABLE_ANSWER[role], degraded=True, fallback="none", reason=reason)
+    timing.ask_answers.inc((role, outcome.fallback, reason))
+    return outcome
+
+
+async def generate_role_answer(role: str, query: str, top_k: int = 5) -> AskResponse:
+    # Найденные чанки переживают таймаут LLM - из них и собирается деградированный ответ
+    context_chunks = []
+    with deadline.scope(ASK_DEADLINE):
+        try:
+            # Роль совпадает с аудиторией чанков: детям - только детский подындекс
+            context_chunks = await search.search(query, top_k=top_k, audience=role)
+            llm_answer = await ask_llm(build_prompt(role, query, context_chunks))
+        except Exception as e:
+            logger.warning("/ask/%s degraded: %s: %s", role, type(e).__name__, e)
+            return degraded_answer(role, query, context_chunks, _reason(e))
+
+    answer_cache.put(role, query, llm_answer)
+    timing.ask_answers.inc((role, "full", ""))
+    return AskResponse(llm_answer=llm_answer)
 
 
 @router.post("/children", response_model=AskResponse)
-def ask_children(request: AskRequest):
-    try:
-        llm_answer = generate_role_answer("children", request.prompt)
-        return AskResponse(llm_answer=llm_answer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def ask_children(request: AskRequest):
+    return await generate_role_answer("children", request.prompt)
 
 
 @router.post("/parent", response_model=AskResponse)
-def ask_parent(request: AskRequest):
-    try:
-        llm_answer = generate_role_answer("parent", request.prompt)
-        return AskResponse(llm_answer=llm_answer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def ask_parent(request: AskRequest):
+    return await generate_role_answer("parent", request.prompt)
@@ -4,12 +4,13 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic import BaseModel, field_validator 
-import re 
 
 from app.core.deps import get_current_user
 from app.database import get_session
 from app.models import Family, User, UserRole
-from app.core.security import get_password_hash, verify_password, create_access_token
+from app.core.security import get_password_hash, check_password, create_access_token
+from app.core.ratelimit import admit
+from app.core.phone import normalize_phone
 
 from decimal import Decimal
 
@@ -30,18 +31,7 @@ class UserRegistration(BaseModel):
     @field_validator('phone_number')
     @classmethod
     def validate_phone(cls, v: str) -> str:
-        clean_number = v.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
-        
-        if not clean_number.isdigit():
-            raise ValueError('Номер должен содержать только цифры')
-        
-        if len(clean_number) == 10 and clean_number.startswith("0"):
-            clean_number = clean_number[1:]
-            
-        if len(clean_number) != 9:
-            raise ValueError('Номер должен состоять из 9 цифр (код оператора + номер). Например: 555123456')
-        
-        return f"+996{clean_number}"
+        return normalize_phone(v)
 
 class ChildRegistration(BaseModel):
     phone_number: str 
@@ -57,18 +47,7 @@ class ChildRegistration(BaseModel):
     @field_validator('phone_number')
     @classmethod
     def validate_phone(cls, v: str) -> str:
-        clean_number = v.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
-        
-        if not clean_number.isdigit():
-            raise ValueError('Номер должен содержать только цифры')
-        
-        if len(clean_number) == 10 and clean_number.startswith("0"):
-            clean_number = clean_number[1:]
-            
-        if len(clean_number) != 9:
-            raise ValueError('Номер должен состоять из 9 цифр (код оператора + номер). Например: 555123456')
-        
-        return f"+996{clean_number}"
+        return normalize_phone(v)
     
 
 
@@ -136,23 +115,20 @@ async def register_child(
     return {"message": "User registered successfully"}
 
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(admit("login"))])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     session: AsyncSession = Depends(get_session)
 ):
-    input_phone = form_data.username
-    
-    clean = input_phone.replace(" ", "").replace("+996", "") 
-    if len(clean) == 10 and clean.startswith("0"):
-        clean = clean[1:]
-    
-    db_format_phone = f"+996{clean}"
+    try:
+        db_format_phone = normalize_phone(form_data.username)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Incorrect phone or password")
 
     stmt = select(User).where(User.phone_number == db_format_phone)
     user = (await session.exec(stmt)).first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await check_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect phone or password")
     
     access_token = create_access_token(data={"sub": user.phone_number})
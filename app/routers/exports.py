@@ -0,0 +1,131 @@
+# app/routers/exports.py
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import engine, get_session
+from app.models import Transaction, User, UserRole
+from app.core.deps import get_current_user
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+
+# Столько строк за раз тянем из серверного курсора и отдаём одним куском
+EXPORT_BATCH = 1000
+
+COLUMNS = ["id", "timestamp", "amount", "description", "sender_id", "sender_name", "receiver_id", "receiver_name"]
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    JSONL = "jsonl"
+
+
+def _render_csv(rows, names: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            row.id, row.timestamp.isoformat(), row.amount, row.description,
+            row.sender_id, names.get(row.sender_id, ""), row.receiver_id, names.get(row.receiver_id, ""),
+        ])
+    return buffer.getvalue()
+
+
+def _render_jsonl(rows, names: dict):
+    return "".join(
+        json.dumps({
+            "id": row.id,
+            "timestamp": row.timestamp.isoformat(),
+            "amount": str(row.amount),
+            "description": row.description,
+            "sender_id": row.sender_id,
+            "sender_name": names.get(row.sender_id, ""),
+            "receiver_id": row.receiver_id,
+            "receiver_name": names.get(row.receiver_id, ""),
+        }, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+async def _stream_rows(stmt, fmt: ExportFormat, names: dict, compress: bool):
+    # Своё соединение и серверный курсор asyncpg: в памяти не больше одной
+    # пачки, а следующая читается, только когда клиент забрал предыдущую
+    # (send в StreamingResponse ждёт, пока освободится буфер сокета)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    render = _render_csv if fmt == ExportFormat.CSV else _render_jsonl
+
+    header = ",".join(COLUMNS) + "\r\n" if fmt == ExportFormat.CSV else ""
+    pending = header.encode()
+
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=EXPORT_BATCH))
+        async for rows in result.partitions():
+            data = pending + render(rows, names).encode()
+            pending = b""
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+
+    # pending не пуст, только если строк не было вовсе - тогда это заголовок
+    tail = compressor.compress(pending) + compressor.flush() if compressor else pending
+    if tail:
+        yield tail
+
+
+@router.get("/transactions")
+async def export_transactions(
+    format: ExportFormat = ExportFormat.CSV,
+    gzip: bool = False,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    # Родитель выгружает всю семью, ребёнок - только свои переводы
+    if current_user.role == UserRole.PARENT and current_user.family_id is not None:
+        result = await session.exec(
+            select(User.id, User.name, User.surname).where(User.family_id == current_user.family_id)
+        )
+        names = {uid: f"{name} {surname}" for uid, name, surname in result.all()}
+    else:
+        names = {current_user.id: f"{current_user.name} {current_user.surname}"}
+    # Соединение сессии не держим, пока идёт выгрузка
+    await session.close()
+
+    stmt = (
+        select(
+            Transaction.id, Transaction.timestamp, Transaction.amount, Transaction.description,
+            Transaction.sender_id, Transaction.receiver_id,
+        )
+        # Переводы только внутри семьи: условие на family_id читает одну секцию
+        .where(Transaction.family_id == current_user.family_id)
+        .order_by(Transaction.timestamp, Transaction.id)
+    )
+    if current_user.role != UserRole.PARENT:
+        stmt = stmt.where(or_(Transaction.sender_id == current_user.id, Transaction.receiver_id == current_user.id))
+    if created_from is not None:
+        stmt = stmt.where(Transaction.timestamp >= created_from.replace(tzinfo=None))
+    if created_to is not None:
+        stmt = stmt.where(Transaction.timestamp < created_to.replace(tzinfo=None))
+
+    filename = f"transactions-{datetime.utcnow():%Y%m%d}.{format.value}"
+    media_type = "text/csv; charset=utf-8" if format == ExportFormat.CSV else "application/x-ndjson"
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        _stream_rows(stmt, format, names, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
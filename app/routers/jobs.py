@@ -0,0 +1,117 @@
+# app/routers/jobs.py
+import os
+import secrets
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import BaseModel, Field
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import get_session
+from app.models import Job, JobStatus, User, UserRole
+from app.core.deps import get_current_user
+from app.services import jobs
+from app.services import job_handlers  # noqa: F401 - регистрирует типы заданий
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+# Служебные задания (пересборки, сверки) ставятся только с этим ключом
+JOBS_API_KEY = os.getenv("JOBS_API_KEY")
+
+MAX_PAYOUTS = 200
+
+
+class JobCreate(BaseModel):
+    type: str
+    payload: dict = Field(default_factory=dict)
+    priority: int = 0
+    delay: float = Field(default=0.0, ge=0)
+
+class PayoutItem(BaseModel):
+    child_id: int
+    amount: Decimal = Field(gt=0)
+    description: str
+
+class BulkPayout(BaseModel):
+    payouts: List[PayoutItem] = Field(min_length=1, max_length=MAX_PAYOUTS)
+
+class JobRead(BaseModel):
+    id: int
+    type: str
+    status: JobStatus
+    priority: int
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    created_at: datetime
+    finished_at: Optional[datetime]
+    last_error: Optional[str]
+    result: Optional[dict]
+
+
+def _require_api_key(x_api_key: Optional[str] = Header(None)):
+    if not JOBS_API_KEY or not x_api_key or not secrets.compare_digest(x_api_key, JOBS_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid API key")
+
+
+@router.post("/", response_model=JobRead, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(_require_api_key)])
+async def enqueue_job(
+    data: JobCreate,
+    session: AsyncSession = Depends(get_session)
+):
+    job = await jobs.enqueue(session, data.type, data.payload, priority=data.priority, delay=data.delay)
+    await session.commit()
+    return job
+
+
+@router.get("/{job_id}", response_model=JobRead, dependencies=[Depends(_require_api_key)])
+async def read_job(
+    job_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    job = await session.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/payouts", response_model=JobRead, status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_payouts(
+    data: BulkPayout,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    if current_user.role != UserRole.PARENT:
+        raise HTTPException(status_code=403, detail="Only parents can pay out")
+
+    child_ids = {p.child_id for p in data.payouts}
+    result = await session.exec(
+        select(User.id).where(
+            User.id.in_(child_ids), User.family_id == current_user.family_id, User.role == UserRole.CHILD,
+        )
+    )
+    if len(result.all()) != len(child_ids):
+        raise HTTPException(status_code=403, detail="This is not your family member!")
+
+    job = await jobs.enqueue(
+        session, "bulk_payout",
+        {"payouts": [p.model_dump(mode="json") for p in data.payouts]},
+        created_by=current_user.id,
+    )
+    await session.commit()
+    return job
+
+
+@router.get("/payouts/{job_id}", response_model=JobRead)
+async def read_payout_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    job = await session.get(Job, job_id)
+    if not job or job.created_by != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional
 from decimal import Decimal
 
 from app.database import get_session
-from app.models import User, Loan, LoanStatus, UserRole, Transaction
+from app.models import User, Loan, LoanStatus, UserRole
 from app.core.deps import get_current_user
+from app.core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page, finish_page, status_in
+from app.services import ledger, rollups
+from app.services.transitions import transition
 
 router = APIRouter(prefix="/loans", tags=["Loans (Microcredit)"])
 
@@ -36,7 +40,8 @@ async def request_loan(
         interest_rate=0.0,
         total_to_pay=data.amount,
         status=LoanStatus.REQUESTED,
-        lender_id=None
+        lender_id=None,
+        family_id=current_user.family_id
     )
     
     session.add(new_loan)
@@ -44,22 +49,59 @@ async def request_loan(
     await session.refresh(new_loan)
     return new_loan
 
+def _filtered(
+    stmt,
+    current_user: User,
+    child_id: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+):
+    # family_id денормализован в loan: join с user не нужен, читается одна секция
+    stmt = stmt.where(Loan.family_id == current_user.family_id)
+    if current_user.role == UserRole.CHILD:
+        stmt = stmt.where(Loan.borrower_id == current_user.id)
+    elif child_id is not None:
+        stmt = stmt.where(Loan.borrower_id == child_id)
+    if created_from is not None:
+        stmt = stmt.where(Loan.created_at >= created_from.replace(tzinfo=None))
+    if created_to is not None:
+        stmt = stmt.where(Loan.created_at < created_to.replace(tzinfo=None))
+    return stmt
+
 @router.get("/", response_model=List[Loan])
 async def get_loans(
+    response: Response,
+    status: Optional[List[LoanStatus]] = Query(None),
+    child_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    if current_user.role == UserRole.CHILD:
-        stmt = select(Loan).where(Loan.borrower_id == current_user.id)
-    else:
-        stmt = (
-            select(Loan)
-            .join(User, Loan.borrower_id == User.id)
-            .where(User.family_id == current_user.family_id)
-        )
-        
+    stmt = _filtered(select(Loan), current_user, child_id, created_from, created_to)
+    if status:
+        stmt = stmt.where(status_in(Loan.status, status))
+    stmt = keyset_page(stmt, Loan.created_at, Loan.id, cursor, limit)
+
     result = await session.exec(stmt)
-    return result.all()
+    # Курсор следующей страницы - в заголовке X-Next-Cursor
+    return finish_page(result.all(), limit, response)
+
+@router.get("/counts", response_model=Dict[LoanStatus, int])
+async def count_loans(
+    child_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    stmt = _filtered(select(Loan.status, func.count()), current_user, child_id, created_from, created_to)
+    result = await session.exec(stmt.group_by(Loan.status))
+    counts = {s: 0 for s in LoanStatus}
+    counts.update(dict(result.all()))
+    return counts
 
 @router.post("/{loan_id}/approve")
 async def approve_loan(
@@ -71,45 +113,24 @@ async def approve_loan(
     if current_user.role != UserRole.PARENT:
         raise HTTPException(status_code=403, detail="Only parents approve loans")
 
-    loan = await session.get(Loan, loan_id)
-    if not loan:
-        raise HTTPException(status_code=404, detail="Loan not found")
-    
-    borrower = await session.get(User, loan.borrower_id)
-    if borrower.family_id != current_user.family_id:
-        raise HTTPException(status_code=403, detail="This is not your family's loan request")
-
-    if loan.status != LoanStatus.REQUESTED:
-        raise HTTPException(status_code=400, detail="Loan is not in requested state")
-
-    if current_user.balance < loan.amount:
-        raise HTTPException(status_code=400, detail="Not enough money")
-
     clean_due_date = approval_data.due_date.replace(tzinfo=None)
 
-    total = loan.amount + (loan.amount * approval_data.interest_rate / 100)
-    
-    loan.status = LoanStatus.ACTIVE
-    loan.interest_rate = approval_data.interest_rate
-    loan.total_to_pay = total
-    loan.due_date = clean_due_date 
-    loan.lender_id = current_user.id 
-
-    current_user.balance -= loan.amount
-    borrower.balance += loan.amount
-
-    transaction = Transaction(
-        amount=loan.amount,
-        sender_id=current_user.id,
-        receiver_id=borrower.id,
-        description=f"Loan issued: {loan.description}"
+    # Условия займа пишутся тем же UPDATE, что и статус
+    [loan] = await transition(
+        session, Loan, loan_id, current_user.family_id, "approve",
+        forbidden="This is not your family's loan request",
+        values={
+            "interest_rate": approval_data.interest_rate,
+            "total_to_pay": Loan.amount + Loan.amount * approval_data.interest_rate / 100,
+            "due_date": clean_due_date,
+            "lender_id": current_user.id,
+        },
+        returning=[Loan],
+    )
+    await ledger.transfer(
+        session, current_user.family_id, current_user.id, loan.borrower_id, loan.amount,
+        f"Loan issued: {loan.description}", rollups.LOAN_ISSUE,
     )
-
-    session.add(loan)
-    session.add(current_user)
-    session.add(borrower)
-    session.add(transaction)
-    
     await session.commit()
     await session.refresh(loan)
     
@@ -121,43 +142,20 @@ async def repay_loan(
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    loan = await session.get(Loan, loan_id)
-    if not loan:
-        raise HTTPException(status_code=404, detail="Loan not found")
-    
-    if loan.borrower_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not your loan")
-        
-    if loan.status != LoanStatus.ACTIVE:
-        raise HTTPException(status_code=400, detail="Loan is not active")
-
-    if current_user.balance < loan.total_to_pay:
-        raise HTTPException(status_code=400, detail="Not enough money to repay")
-
+    loan = await transition(
+        session, Loan, loan_id, current_user.family_id, "repay",
+        guard=Loan.borrower_id == current_user.id, forbidden="Not your loan",
+        returning=[Loan.amount, Loan.total_to_pay, Loan.lender_id, Loan.description],
+    )
     if not loan.lender_id:
         raise HTTPException(status_code=500, detail="Lender information missing")
-        
-    lender = await session.get(User, loan.lender_id)
-    if not lender:
-        raise HTTPException(status_code=404, detail="Lender account not found")
 
-    current_user.balance -= loan.total_to_pay
-    lender.balance += loan.total_to_pay
-    
-    loan.status = LoanStatus.PAID
-    
-    transaction = Transaction(
-        amount=loan.total_to_pay,
-        sender_id=current_user.id,
-        receiver_id=lender.id,
-        description=f"Loan repaid: {loan.description}"
+    await ledger.transfer(
+        session, current_user.family_id, current_user.id, loan.lender_id, loan.total_to_pay,
+        f"Loan repaid: {loan.description}", rollups.LOAN_REPAY,
+        interest=loan.total_to_pay - loan.amount,
+        insufficient="Not enough money to repay",
     )
-
-    session.add(loan)
-    session.add(current_user)
-    session.add(lender)
-    session.add(transaction)
-    
     await session.commit()
     
     return {"message": "Loan repaid successfully!"}
@@ -171,20 +169,9 @@ async def reject_loan(
     if current_user.role != UserRole.PARENT:
         raise HTTPException(status_code=403, detail="Only parents can reject loans")
 
-    loan = await session.get(Loan, loan_id)
-    if not loan:
-        raise HTTPException(status_code=404, detail="Loan not found")
-    
-    borrower = await session.get(User, loan.borrower_id)
-    if borrower.family_id != current_user.family_id:
-        raise HTTPException(status_code=403, detail="Not your family loan")
-
-    if loan.status != LoanStatus.REQUESTED:
-        raise HTTPException(status_code=400, detail="Loan is not in requested state")
-
-    loan.status = LoanStatus.REJECTED
-    
-    session.add(loan)
+    await transition(
+        session, Loan, loan_id, current_user.family_id, "reject", forbidden="Not your family loan",
+    )
     await session.commit()
     
-    return {"message": "Loan request rejected"}
\ No newline at end of file
+    return {"message": "Loan request rejected"}
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.timing import render_metrics
+from app.database import get_session
+from app.services import search
+
+router = APIRouter(tags=["Monitoring"])
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Liveness: процесс жив и event loop отвечает, больше ничего не проверяем
+@router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+# Readiness основного API: нужна только база. /ask может ещё грузиться.
+@router.get("/health/ready")
+async def readiness(session: AsyncSession = Depends(get_session)):
+    try:
+        await session.exec(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "database": str(e), "ask": search.status},
+        )
+    return {"status": "ok", "database": "ok", "ask": search.status}
+
+# Readiness /ask: 200 только когда индекс загружен и прогрет
+@router.get("/health/ask")
+async def ask_readiness():
+    body = {"status": search.status, "error": search.error}
+    if search.status != "ready":
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "5"})
+    return body
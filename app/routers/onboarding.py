@@ -0,0 +1,188 @@
+# app/routers/onboarding.py
+import os
+import secrets
+from decimal import Decimal
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import get_session
+from app.models import Family, User, UserRole
+from app.core.security import hash_passwords
+from app.core.ratelimit import admit
+from app.core.phone import normalize_phone
+
+router = APIRouter(prefix="/onboarding", tags=["Onboarding"])
+
+# Ключ для школ и партнёров; без него пакетный импорт выключен
+ONBOARDING_API_KEY = os.getenv("ONBOARDING_API_KEY")
+
+# До 8 участников на семью - до 160 bcrypt-хэшей (~250мс CPU каждый) за
+# запрос, это секунды даже на нескольких ядрах. Больше - несколькими запросами
+MAX_BATCH_FAMILIES = 20
+# asyncpg не принимает больше 32767 параметров в одном запросе
+USER_INSERT_CHUNK = 2000
+
+PARENT_BALANCE = Decimal("10000.00")
+
+# 8 символов urlsafe - 48 бит, совпадения редки, но при тысячах семей в
+# пакете возможны: такие семьи получают новый код
+INVITE_CODE_BYTES = 6
+INVITE_CODE_ATTEMPTS = 5
+PHONE_CONSTRAINT = "ix_user_phone_number"
+
+
+class MemberData(BaseModel):
+    phone_number: str
+    surname: str
+    name: str
+    paternity: str
+    password: str
+    age: int
+
+    @field_validator('phone_number')
+    @classmethod
+    def validate_phone(cls, v: str) -> str:
+        return normalize_phone(v)
+
+class FamilyOnboarding(BaseModel):
+    family_name: str
+    parents: List[MemberData] = Field(min_length=1, max_length=2)
+    children: List[MemberData] = Field(default_factory=list, max_length=6)
+
+class BatchOnboarding(BaseModel):
+    families: List[FamilyOnboarding] = Field(min_length=1, max_length=MAX_BATCH_FAMILIES)
+
+
+def _members(family: FamilyOnboarding):
+    return [(m, UserRole.PARENT) for m in family.parents] + [(m, UserRole.CHILD) for m in family.children]
+
+
+def _require_api_key(x_api_key: Optional[str] = Header(None)):
+    if not ONBOARDING_API_KEY or not x_api_key or not secrets.compare_digest(x_api_key, ONBOARDING_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid API key")
+
+
+async def _taken_phones(session: AsyncSession, phones: list[str]) -> set[str]:
+    # Одна проверка на всех, а не select на каждого
+    result = await session.exec(select(User.phone_number).where(User.phone_number.in_(phones)))
+    taken = set(result.all())
+    # Соединение не держим, пока считаются хэши
+    await session.commit()
+    return taken
+
+
+def _constraint_name(e: IntegrityError) -> str | None:
+    # asyncpg-исключение лежит под обёрткой DBAPI
+    return getattr(e.orig.__cause__, "constraint_name", None)
+
+
+async def _insert_families(session: AsyncSession, families: list[FamilyOnboarding]) -> list[tuple[int, str]]:
+    created: list[tuple[int, str] | None] = [None] * len(families)
+    for _ in range(INVITE_CODE_ATTEMPTS):
+        pending = {secrets.token_urlsafe(INVITE_CODE_BYTES): i for i, done in enumerate(created) if done is None}
+        if not pending:
+            return created
+        # Занятый код не роняет транзакцию, строка просто не вставится
+        result = await session.exec(
+            pg_insert(Family)
+            .values([{"name": families[i].family_name, "invite_code": code} for code, i in pending.items()])
+            .on_conflict_do_nothing(index_elements=["invite_code"])
+            .returning(Family.id, Family.invite_code)
+        )
+        # Порядок RETURNING при многострочном INSERT не гарантирован
+        for fid, code in result.all():
+            created[pending[code]] = (fid, code)
+    if None in created:
+        raise RuntimeError("Could not generate unique invite codes")
+    return created
+
+
+async def _create_families(session: AsyncSession, families: list[FamilyOnboarding]) -> list[dict]:
+    members = [pair for family in families for pair in _members(family)]
+    hashes = iter(await hash_passwords([m.password for m, _ in members]))
+
+    created = await _insert_families(session, families)
+
+    rows = []
+    for family, (family_id, _) in zip(families, created):
+        for member, role in _members(family):
+            rows.append({
+                "phone_number": member.phone_number,
+                "hashed_password": next(hashes),
+                "surname": member.surname,
+                "name": member.name,
+                "paternity": member.paternity,
+                "age": member.age,
+                "balance": PARENT_BALANCE if role == UserRole.PARENT else Decimal("0.00"),
+                "role": role,
+                "family_id": family_id,
+            })
+    try:
+        for start in range(0, len(rows), USER_INSERT_CHUNK):
+            await session.exec(insert(User).values(rows[start:start + USER_INSERT_CHUNK]))
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        # Кто-то успел зарегистрировать тот же номер между проверкой и вставкой
+        if _constraint_name(e) == PHONE_CONSTRAINT:
+            raise HTTPException(status_code=409, detail="Phone number already registered")
+        raise
+
+    return [{"family_id": family_id, "invite_code": code} for family_id, code in created]
+
+
+@router.post("/family", status_code=status.HTTP_201_CREATED, dependencies=[Depends(admit("onboarding"))])
+async def onboard_family(
+    data: FamilyOnboarding,
+    session: AsyncSession = Depends(get_session)
+):
+    phones = [m.phone_number for m, _ in _members(data)]
+    if len(set(phones)) != len(phones):
+        raise HTTPException(status_code=400, detail="Duplicate phone numbers in request")
+    if await _taken_phones(session, phones):
+        raise HTTPException(status_code=400, detail="Phone number already registered")
+
+    [created] = await _create_families(session, [data])
+    return {"message": "Family registered successfully", **created}
+
+
+@router.post("/batch", status_code=status.HTTP_201_CREATED, dependencies=[Depends(_require_api_key)])
+async def onboard_batch(
+    data: BatchOnboarding,
+    session: AsyncSession = Depends(get_session)
+):
+    # Семьи с занятыми или повторяющимися номерами пропускаем с причиной,
+    # остальные создаются одной транзакцией
+    phones = [m.phone_number for family in data.families for m, _ in _members(family)]
+    taken = await _taken_phones(session, phones)
+
+    seen = set()
+    accepted, results = [], []
+    for index, family in enumerate(data.families):
+        family_phones = [m.phone_number for m, _ in _members(family)]
+        if taken.intersection(family_phones):
+            results.append({"index": index, "error": "Phone number already registered"})
+        elif seen.intersection(family_phones) or len(set(family_phones)) != len(family_phones):
+            results.append({"index": index, "error": "Duplicate phone numbers in request"})
+        else:
+            seen.update(family_phones)
+            accepted.append(index)
+            results.append(None)
+
+    if accepted:
+        created = await _create_families(session, [data.families[i] for i in accepted])
+        for index, info in zip(accepted, created):
+            results[index] = {"index": index, **info}
+
+    return {
+        "created": len(accepted),
+        "rejected": len(data.families) - len(accepted),
+        "families": results,
+    }
@@ -1,14 +1,19 @@
 # app/routers/tasks.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
+from datetime import datetime
 from decimal import Decimal
 
 from app.database import get_session
-from app.models import User, Task, TaskStatus, UserRole, Transaction
+from app.models import User, Task, TaskStatus, UserRole
 from app.core.deps import get_current_user
+from app.core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page, finish_page, status_in
+from app.services import ledger, rollups
+from app.services.transitions import transition
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
@@ -47,6 +52,7 @@ async def create_task(
         reward=task_data.reward,
         child_id=child.id,
         creator_id=current_user.id,
+        family_id=current_user.family_id,
         status=TaskStatus.NEW
     )
     
@@ -55,17 +61,61 @@ async def create_task(
     await session.refresh(new_task)
     return new_task
 
+def _filtered(
+    stmt,
+    current_user: User,
+    child_id: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+):
+    # Условие на family_id - для отсечения секций, остальные фильтры ищут внутри одной
+    stmt = stmt.where(Task.family_id == current_user.family_id)
+    if current_user.role == UserRole.CHILD:
+        stmt = stmt.where(Task.child_id == current_user.id)
+    else:
+        stmt = stmt.where(Task.creator_id == current_user.id)
+        if child_id is not None:
+            stmt = stmt.where(Task.child_id == child_id)
+    if created_from is not None:
+        stmt = stmt.where(Task.created_at >= created_from.replace(tzinfo=None))
+    if created_to is not None:
+        stmt = stmt.where(Task.created_at < created_to.replace(tzinfo=None))
+    return stmt
+
 @router.get("/", response_model=List[Task])
 async def get_tasks(
+    response: Response,
+    status: Optional[List[TaskStatus]] = Query(None),
+    child_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    if current_user.role == UserRole.CHILD:
-        stmt = select(Task).where(Task.child_id == current_user.id)
-    else:
-        stmt = select(Task).where(Task.creator_id == current_user.id)
+    stmt = _filtered(select(Task), current_user, child_id, created_from, created_to)
+    if status:
+        stmt = stmt.where(status_in(Task.status, status))
+    stmt = keyset_page(stmt, Task.created_at, Task.id, cursor, limit)
+
     result = await session.exec(stmt)
-    return result.all()
+    # Курсор следующей страницы - в заголовке X-Next-Cursor
+    return finish_page(result.all(), limit, response)
+
+@router.get("/counts", response_model=Dict[TaskStatus, int])
+async def count_tasks(
+    child_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    stmt = _filtered(select(Task.status, func.count()), current_user, child_id, created_from, created_to)
+    result = await session.exec(stmt.group_by(Task.status))
+    counts = {s: 0 for s in TaskStatus}
+    counts.update(dict(result.all()))
+    return counts
 
 @router.post("/{task_id}/submit")
 async def submit_task(
@@ -73,13 +123,10 @@ async def submit_task(
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    task = await session.get(Task, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if task.child_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not your task!")
-    task.status = TaskStatus.WAITING_APPROVAL
-    session.add(task)
+    await transition(
+        session, Task, task_id, current_user.family_id, "submit",
+        guard=Task.child_id == current_user.id, forbidden="Not your task!",
+    )
     await session.commit()
     return {"message": "Task submitted for approval"}
 
@@ -92,37 +139,23 @@ async def approve_task(
     if current_user.role != UserRole.PARENT:
         raise HTTPException(status_code=403, detail="Only parents can approve")
 
-    task = await session.get(Task, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if task.status == TaskStatus.DONE:
-        raise HTTPException(status_code=400, detail="Already paid!")
-
-    if current_user.balance < task.reward:
-        raise HTTPException(status_code=400, detail="Not enough money on balance!")
-        
-    current_user.balance -= task.reward
-    
-    child = await session.get(User, task.child_id)
-    child.balance += task.reward
-    
-    task.status = TaskStatus.DONE
-    
-    transaction = Transaction(
-        amount=task.reward,
-        sender_id=current_user.id,
-        receiver_id=child.id,
-        description=f"Payment for task: {task.title}"
+    # Статус и оплата - в одной транзакции: если денег не хватит, откатится и статус
+    task = await transition(
+        session, Task, task_id, current_user.family_id, "approve",
+        forbidden="Not your family's task",
+        returning=[
+            Task.reward, Task.child_id, Task.title,
+            select(User.name).where(User.id == Task.child_id).scalar_subquery().label("child_name"),
+        ],
+    )
+    await ledger.transfer(
+        session, current_user.family_id, current_user.id, task.child_id, task.reward,
+        f"Payment for task: {task.title}", rollups.TASK_REWARD,
+        insufficient="Not enough money on balance!",
     )
-    
-    session.add(current_user)
-    session.add(child)
-    session.add(task)
-    session.add(transaction)
-    
     await session.commit()
     
-    return {"message": f"Task approved! Paid {task.reward} to {child.name}"}
+    return {"message": f"Task approved! Paid {task.reward} to {task.child_name}"}
 
 @router.post("/{task_id}/reject")
 async def reject_task(
@@ -133,13 +166,9 @@ async def reject_task(
     if current_user.role != UserRole.PARENT:
         raise HTTPException(status_code=403, detail="Only parents can reject")
 
-    task = await session.get(Task, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-
-    task.status = TaskStatus.NEW 
-    
-    session.add(task)
+    await transition(
+        session, Task, task_id, current_user.family_id, "reject", forbidden="Not your family's task",
+    )
     await session.commit()
     
-    return {"message": "Task rejected and sent back to child."}
\ No newline at end of file
+    return {"message": "Task rejected and sent back to child."}
@@ -0,0 +1,37 @@
+# app/services/answer_cache.py
+# Последние удачные ответы /ask в памяти процесса. Нужны только как запасной
+# вариант, когда LLM не успела к дедлайну: свежий запрос всегда идёт в LLM.
+import os
+import time
+from collections import OrderedDict
+
+ASK_CACHE_SIZE = int(os.getenv("ASK_CACHE_SIZE", "2048"))
+ASK_CACHE_TTL = float(os.getenv("ASK_CACHE_TTL", str(24 * 3600)))
+
+# (роль, нормализованный вопрос) -> (когда сохранён, ответ)
+_answers: OrderedDict[tuple[str, str], tuple[float, str]] = OrderedDict()
+
+
+def _key(role: str, query: str) -> tuple[str, str]:
+    return role, " ".join(query.lower().split())
+
+
+def get(role: str, query: str) -> str | None:
+    key = _key(role, query)
+    entry = _answers.get(key)
+    if entry is None:
+        return None
+    saved_at, answer = entry
+    if time.monotonic() - saved_at > ASK_CACHE_TTL:
+        del _answers[key]
+        return None
+    _answers.move_to_end(key)
+    return answer
+
+
+def put(role: str, query: str, answer: str):
+    key = _key(role, query)
+    _answers[key] = (time.monotonic(), answer)
+    _answers.move_to_end(key)
+    while len(_answers) > ASK_CACHE_SIZE:
+        _answers.popitem(last=False)
@@ -0,0 +1,125 @@
+# app/services/audience.py
+# Разметка чанков по аудитории и подындексы под неё.
+#
+#   python -m app.services.audience                  # data/ по умолчанию
+#   python -m app.services.audience --selector-only  # только списки id, без подындексов
+#
+# Каждый чанк получает поле "audience_auto" - список ролей, которым его можно
+# показывать по эвристике; при каждом запуске оно пересчитывается заново.
+# Поле "audience" - только ручная разметка, build его не трогает. Для роли,
+# которой доступна только часть корпуса, рядом с index.faiss пишутся
+# index.<роль>.ids.npy (номера чанков) и index.<роль>.faiss (те же векторы,
+# только эти чанки). search.search ищет по подындексу, а если его нет - по
+# полному индексу с IDSelector.
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+AUDIENCES = ("children", "parent")
+
+# Взрослые темы: детям такие чанки в контекст не попадают. Основы слов
+# ищем только с начала слова, иначе "акци" ловит "транзакцию" и "вакцину",
+# а "налог" - "аналог".
+ADULT_MARKERS = (
+    r"кредит", r"ипотек", r"налог", r"ндфл", r"вычет", r"инвестиц", r"брокер", r"облигац",
+    r"акци(?:[яиюй]|ей|ям|ями|ях|онер)", r"пенси", r"страхов", r"залог", r"рефинанс",
+    r"коллектор", r"банкрот", r"микрозайм",
+)
+ADULT_PATTERN = re.compile(r"\b(?:" + "|".join(ADULT_MARKERS) + ")", re.IGNORECASE)
+
+
+def auto_tags(chunk: dict) -> list[str]:
+    if ADULT_PATTERN.search(chunk.get("text", "")):
+        return ["parent"]
+    return list(AUDIENCES)
+
+
+def tag_chunk(chunk: dict) -> list[str]:
+    # Ручная разметка в chunks.json важнее эвристики
+    if chunk.get("audience"):
+        return list(chunk["audience"])
+    return auto_tags(chunk)
+
+
+def ids_path(data_dir: Path, audience: str) -> Path:
+    return data_dir / f"index.{audience}.ids.npy"
+
+
+def index_path(data_dir: Path, audience: str) -> Path:
+    return data_dir / f"index.{audience}.faiss"
+
+
+def all_vectors(index) -> np.ndarray:
+    import faiss
+
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        # IVF без direct map не умеет reconstruct
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+
+def subset_index(full, vectors: np.ndarray, ids: np.ndarray):
+    import faiss
+
+    # clone + reset сохраняет тип и обученный квантизатор (IVF, PQ)
+    sub = faiss.clone_index(full)
+    sub.reset()
+    sub.add(vectors[ids])
+    return sub
+
+
+def build(data_dir: Path, selector_only: bool = False) -> dict:
+    import faiss
+
+    chunks_json = data_dir / "chunks.json"
+    with open(chunks_json, encoding="utf-8") as f:
+        chunks = json.load(f)
+    # Старый build писал эвристику прямо в "audience" всех чанков - такой
+    # файл ручной разметки не содержит, иначе он так и не перетегируется
+    if chunks and all("audience" in c and "audience_auto" not in c for c in chunks):
+        for chunk in chunks:
+            del chunk["audience"]
+    for chunk in chunks:
+        chunk["audience_auto"] = auto_tags(chunk)
+    tags = [tag_chunk(chunk) for chunk in chunks]
+
+    tmp = chunks_json.with_name(f"{chunks_json.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    os.replace(tmp, chunks_json)
+
+    full = faiss.read_index(str(data_dir / "index.faiss"))
+    vectors = None
+    sizes = {}
+    for audience in AUDIENCES:
+        ids = np.array([i for i in range(len(chunks)) if audience in tags[i]], dtype="int64")
+        sizes[audience] = len(ids)
+        ids_path(data_dir, audience).unlink(missing_ok=True)
+        index_path(data_dir, audience).unlink(missing_ok=True)
+        # Роли, которой виден весь корпус, фильтр не нужен
+        if len(ids) == len(chunks):
+            continue
+
+        np.save(ids_path(data_dir, audience), ids)
+        if not selector_only:
+            if vectors is None:
+                vectors = all_vectors(full)
+            faiss.write_index(subset_index(full, vectors, ids), str(index_path(data_dir, audience)))
+
+    return {"chunks": len(chunks), **sizes}
+
+
+if __name__ == "__main__":
+    from app.services.search import DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Разметить чанки по аудитории и построить подындексы")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--selector-only", action="store_true", help="без подындексов, фильтр через IDSelector")
+    args = parser.parse_args()
+    print(build(args.data_dir, args.selector_only))
@@ -0,0 +1,69 @@
+import errno
+import json
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class ChunkStore:
+    # chunks.json один раз перекладывается в chunks.bin (JSON каждого чанка подряд)
+    # и chunks.offsets.npy (границы). Оба файла открываются через mmap, поэтому
+    # все воркеры читают одни и те же страницы page cache, а не держат свой список dict.
+    def __init__(self, json_path: Path):
+        self.blob_path = json_path.with_suffix(".bin")
+        self.offsets_path = json_path.with_suffix(".offsets.npy")
+
+        if not self._is_fresh(json_path):
+            self._build(json_path)
+
+        with open(self.blob_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._blob = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = np.load(self.offsets_path, mmap_mode="r")
+
+    def _is_fresh(self, json_path: Path) -> bool:
+        if not (self.blob_path.exists() and self.offsets_path.exists()):
+            return False
+        source_mtime = json_path.stat().st_mtime
+        return min(self.blob_path.stat().st_mtime, self.offsets_path.stat().st_mtime) >= source_mtime
+
+    def _build(self, json_path: Path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+
+        offsets = np.zeros(len(chunks) + 1, dtype=np.uint64)
+        blob_tmp = self.blob_path.with_name(f"{self.blob_path.name}.{os.getpid()}.tmp")
+        offsets_tmp = self.offsets_path.with_name(f"{self.offsets_path.stem}.{os.getpid()}.tmp.npy")
+
+        with open(blob_tmp, "wb") as out:
+            position = 0
+            for i, chunk in enumerate(chunks):
+                data = json.dumps(chunk, ensure_ascii=False).encode("utf-8")
+                out.write(data)
+                position += len(data)
+                offsets[i + 1] = position
+        np.save(offsets_tmp, offsets)
+
+        # Атомарная замена: воркеры без preload могут строить кэш одновременно
+        os.replace(blob_tmp, self.blob_path)
+        os.replace(offsets_tmp, self.offsets_path)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> dict:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._blob[start:end])
+
+
+def load_chunks(json_path: Path):
+    try:
+        return ChunkStore(json_path)
+    except OSError as e:
+        # data/ только для чтения - откатываемся на обычный список
+        if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+            raise
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import time
+
+from app.core import deadline
+
+api_key = os.getenv("GEMINI_API_KEY") # <- укажи свой api_key
+# GEMINI_BASE_URL позволяет направить клиента на локальный фейк (bench/fake_gemini.py)
+base_url = os.getenv("GEMINI_BASE_URL")
+
+# Один клиент на процесс: llm и эмбеддер делят пул соединений client.aio.
+# google.genai импортируется почти секунду, поэтому и он, и клиент - лениво.
+_client = None
+
+GENERATE_TIMEOUT = float(os.getenv("GEMINI_GENERATE_TIMEOUT", "20"))
+EMBED_TIMEOUT = float(os.getenv("GEMINI_EMBED_TIMEOUT", "3"))
+# Если эмбеддинг не пришёл за это время, параллельно шлём второй такой же запрос
+EMBED_HEDGE_DELAY = float(os.getenv("GEMINI_EMBED_HEDGE_DELAY", "0.3"))
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class UpstreamTimeout(UpstreamError):
+    pass
+
+
+class UpstreamUnavailable(UpstreamError):
+    def __init__(self, retry_after: float):
+        super().__init__("Gemini is unavailable, failing fast")
+        self.retry_after = retry_after
+
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    from google.genai import errors
+
+    # 4xx - проблема запроса, а не Gemini; кроме 429, это квота
+    if isinstance(exc, errors.ClientError):
+        return exc.code == 429
+    return True
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _before_call(self):
+        if self.state == "open":
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise UpstreamUnavailable(self.reset_timeout - elapsed)
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            # Пока пробный запрос не вернулся, остальных не пускаем
+            if self._probing:
+                raise UpstreamUnavailable(1.0)
+            self._probing = True
+
+    def _on_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def _on_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    async def call(self, make_call, timeout: float):
+        deadline.check(self.name)
+        # Дедлайн запроса ближе своего таймаута: если истечёт он, Gemini не виноват
+        left = deadline.remaining()
+        budget_bound = left is not None and left < timeout
+        self._before_call()
+        try:
+            result = await asyncio.wait_for(make_call(), timeout=left if budget_bound else timeout)
+        except asyncio.TimeoutError:
+            if budget_bound:
+                self._probing = False
+                raise deadline.DeadlineExceeded(f"{self.name} did not answer before the request deadline")
+            self._on_failure()
+            raise UpstreamTimeout(f"{self.name} did not answer in {timeout}s")
+        except asyncio.CancelledError:
+            self._probing = False
+            raise
+        except Exception as e:
+            if _is_upstream_failure(e):
+                self._on_failure()
+            else:
+                self._probing = False
+            raise UpstreamError(f"{self.name} failed: {e}") from e
+
+        self._on_success()
+        return result
+
+
+generate_breaker = CircuitBreaker("gemini.generate_content")
+embed_breaker = CircuitBreaker("gemini.embed_content")
+
+
+async def hedged(make_call, delay: float, max_attempts: int = 2):
+    # Вторая попытка уходит, если первая не успела за delay или упала;
+    # берём первый успешный ответ, остальные отменяем
+    pending = {asyncio.ensure_future(make_call())}
+    launched = 1
+    error = None
+    try:
+        while pending:
+            timeout = delay if launched < max_attempts else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if launched < max_attempts:
+                pending.add(asyncio.ensure_future(make_call()))
+                launched += 1
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        if not api_key:
+            raise UpstreamError("GEMINI_API_KEY is not set")
+        from google import genai
+        from google.genai import types
+
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        _client = genai.Client(api_key=api_key, http_options=http_options)
+    return _client
+
+
+async def generate_content(prompt: str, model_name: str) -> str:
+    aio = get_client().aio
+    response = await generate_breaker.call(
+        lambda: aio.models.generate_content(model=model_name, contents=prompt),
+        GENERATE_TIMEOUT,
+    )
+    return response.text
+
+
+async def embed_content(contents: list[dict], dimensionality: int):
+    from google.genai import types
+
+    aio = get_client().aio
+    config = types.EmbedContentConfig(output_dimensionality=dimensionality)
+    result = await embed_breaker.call(
+        lambda: hedged(
+            lambda: aio.models.embed_content(model="gemini-embedding-001", contents=contents, config=config),
+            EMBED_HEDGE_DELAY,
+        ),
+        EMBED_TIMEOUT,
+    )
+    return result.embeddings
@@ -0,0 +1,107 @@
+# app/services/job_handlers.py
+# Типы фоновых заданий. Обработчик получает Job и возвращает JSON-результат,
+# исключение означает неудачную попытку (повтор с backoff, см. app/services/jobs.py).
+# Обработчик может выполниться повторно, поэтому каждый либо идемпотентен,
+# либо делает всю работу одной транзакцией.
+import asyncio
+from decimal import Decimal
+
+from fastapi import HTTPException
+from sqlalchemy import func, text, update
+from sqlmodel import select
+
+from app.database import async_session, engine
+from app.models import Job, JobStatus, User, UserRole
+from app.services import ledger, rollups
+from app.services.jobs import PermanentError, job_type
+
+RECONCILE_SAMPLE = 20
+
+
+@job_type("rebuild_rollups", concurrency=1, max_attempts=3, timeout=3600)
+async def rebuild_rollups(job: Job):
+    async with engine.begin() as conn:
+        await conn.run_sync(rollups.rebuild)
+        rows = (await conn.execute(text("SELECT count(*) FROM dailyrollup"))).scalar_one()
+    return {"rows": rows}
+
+
+@job_type("reconcile_rollups", concurrency=1, max_attempts=3, timeout=3600)
+async def reconcile_rollups(job: Job):
+    # Только отчёт: чинит rebuild_rollups
+    async with engine.connect() as conn:
+        mismatches = (await conn.execute(text(rollups.RECONCILE_SQL))).mappings().all()
+    return {
+        "mismatches": len(mismatches),
+        "sample": [
+            {key: str(value) if value is not None else None for key, value in row.items()}
+            for row in mismatches[:RECONCILE_SAMPLE]
+        ],
+    }
+
+
+@job_type("rebuild_search_index", concurrency=1, max_attempts=2, timeout=3600)
+async def rebuild_search_index(job: Job):
+    # Пересобирает файлы рядом с index.faiss; воркеры API подхватят их при следующем старте
+    from app.services import audience, matryoshka
+    from app.services.search import DATA_DIR
+
+    result = {"audience": await asyncio.to_thread(audience.build, DATA_DIR, job.payload.get("selector_only", False))}
+    dim = job.payload.get("coarse_dim")
+    if dim:
+        result["coarse"] = await asyncio.to_thread(matryoshka.build, DATA_DIR, int(dim), job.payload.get("factory", "Flat"))
+    return result
+
+
+@job_type("bulk_payout", concurrency=4, max_attempts=5, timeout=300)
+async def bulk_payout(job: Job):
+    # Все выплаты и результат задания - одной транзакцией: если воркер упал
+    # после коммита, повтор увидит result и не заплатит второй раз.
+    # job.locked_by - id воркера, который выполняет эту попытку (его ставит claim)
+    if job.result is not None:
+        return job.result
+    payouts = job.payload["payouts"]
+    async with async_session() as session:
+        payer = await session.get(User, job.created_by)
+        child_ids = {p["child_id"] for p in payouts}
+        children = (await session.exec(
+            select(User.id).where(
+                User.id.in_(child_ids), User.family_id == payer.family_id, User.role == UserRole.CHILD,
+            )
+        )).all()
+        if len(children) != len(child_ids):
+            # Ребёнка перевели в другую семью, пока задание ждало
+            raise PermanentError("Some children are not in the payer's family")
+
+        total = Decimal("0.00")
+        for payout in payouts:
+            amount = Decimal(payout["amount"])
+            try:
+                await ledger.transfer(
+                    session, payer.family_id, payer.id, payout["child_id"], amount,
+                    f"Payout: {payout['description']}", rollups.PAYOUT,
+                    insufficient="Not enough money for the payouts",
+                )
+            except HTTPException as e:
+                raise PermanentError(e.detail)
+            total += amount
+
+        result = {"paid": len(payouts), "total": str(total)}
+        # Пока шли переводы, аренда могла истечь и задание - уйти другому
+        # воркеру. Коммитит только попытка, которая всё ещё держит задание и
+        # первой записала result; остальные откатывают свои переводы.
+        saved = await session.exec(
+            update(Job)
+            .where(
+                # Пустой result в JSONB - это и SQL NULL, и JSON null
+                Job.id == job.id, func.coalesce(func.jsonb_typeof(Job.result), "null") == "null",
+                Job.status == JobStatus.RUNNING, Job.locked_by == job.locked_by,
+            )
+            .values(result=result)
+            .returning(Job.id)
+        )
+        if saved.first() is None:
+            await session.rollback()
+            raise RuntimeError("Job is no longer held by this attempt, payouts rolled back")
+        await session.commit()
+    return result
@@ -0,0 +1,182 @@
+# app/services/jobs.py
+# Очередь фоновых заданий в Postgres. API кладёт строку в job в своей же
+# транзакции, воркер (python -m app.worker) забирает её через
+# SELECT ... FOR UPDATE SKIP LOCKED: несколько воркеров не ждут друг друга
+# и никогда не получают одно задание дважды. Лимит concurrency типа общий для
+# всех воркеров и проверяется там же, в claim.
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Job, JobStatus
+
+# Повтор через BACKOFF_BASE * 2^(попытка-1) секунд, но не дольше BACKOFF_MAX
+BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "3600"))
+# Воркер обновляет heartbeat_at; задание без отметки дольше LEASE считается
+# брошенным (воркер упал) и возвращается в очередь как неудачная попытка
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))
+
+MAX_ERROR_CHARS = 2000
+
+# Пространство ключей pg_advisory_xact_lock(класс, hashtext(тип)) для claim
+JOB_LOCK_CLASS = 7355609
+
+
+class PermanentError(Exception):
+    # Повтор не поможет (неверные данные, нет денег): задание сразу в failed
+    pass
+
+
+@dataclass(frozen=True)
+class JobType:
+    handler: Callable[[Job], Awaitable[Optional[dict]]]
+    concurrency: int        # одновременно на все воркеры
+    max_attempts: int
+    timeout: float          # секунд на одну попытку
+
+
+JOB_TYPES: dict[str, JobType] = {}
+
+
+def job_type(name: str, concurrency: int = 1, max_attempts: int = 5, timeout: float = 600.0):
+    def decorator(handler):
+        JOB_TYPES[name] = JobType(handler, concurrency, max_attempts, timeout)
+        return handler
+    return decorator
+
+
+def backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    # Разброс, чтобы упавшие вместе задания не повторялись тоже вместе
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def enqueue(
+    session: AsyncSession,
+    type: str,
+    payload: dict | None = None,
+    priority: int = 0,
+    delay: float = 0.0,
+    created_by: int | None = None,
+    max_attempts: int | None = None,
+) -> Job:
+    # Коммитит вызывающий: задание появится вместе с остальными изменениями или не появится вовсе
+    spec = JOB_TYPES.get(type)
+    if spec is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job type: {type}")
+    job = Job(
+        type=type,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=max_attempts or spec.max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        created_by=created_by,
+    )
+    session.add(job)
+    return job
+
+
+async def claim(session: AsyncSession, types: list[str], worker_id: str) -> Job | None:
+    types = list(types)
+    while types:
+        now = datetime.utcnow()
+        candidate = (await session.exec(
+            select(Job.id, Job.type)
+            .where(Job.status == JobStatus.QUEUED, Job.run_at <= now, Job.type.in_(types))
+            .order_by(Job.priority.desc(), Job.run_at, Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).first()
+        if candidate is None:
+            break
+        job_id, name = candidate
+
+        # Лимит concurrency - на все воркеры сразу: подсчёт running и захват идут
+        # под advisory-блокировкой типа, которая держится до коммита, так что
+        # следующий воркер посчитает уже с этим заданием
+        await session.exec(select(func.pg_advisory_xact_lock(JOB_LOCK_CLASS, func.hashtext(name))))
+        running = (await session.exec(
+            select(func.count()).select_from(Job).where(Job.type == name, Job.status == JobStatus.RUNNING)
+        )).scalar_one()
+        if running >= JOB_TYPES[name].concurrency:
+            types.remove(name)
+            continue
+
+        result = await session.exec(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status=JobStatus.RUNNING, attempts=Job.attempts + 1, locked_by=worker_id, heartbeat_at=now)
+            .returning(Job)
+            .execution_options(synchronize_session=False)
+        )
+        job = result.one()[0]
+        await session.commit()
+        return job
+
+    await session.commit()
+    return None
+
+
+def _owned(job_id: int, worker_id: str):
+    # Если задание успели вернуть в очередь как брошенное, результат этого воркера не пишем
+    return update(Job).where(Job.id == job_id, Job.status == JobStatus.RUNNING, Job.locked_by == worker_id)
+
+
+async def complete(session: AsyncSession, job: Job, worker_id: str, result: dict | None):
+    await session.exec(_owned(job.id, worker_id).values(
+        status=JobStatus.DONE, result=result, finished_at=datetime.utcnow(), locked_by=None, last_error=None,
+    ))
+    await session.commit()
+
+
+async def fail(session: AsyncSession, job: Job, worker_id: str, error: str, permanent: bool = False):
+    error = error[:MAX_ERROR_CHARS]
+    if permanent or job.attempts >= job.max_attempts:
+        values = {"status": JobStatus.FAILED, "finished_at": datetime.utcnow()}
+    else:
+        values = {"status": JobStatus.QUEUED, "run_at": datetime.utcnow() + timedelta(seconds=backoff(job.attempts))}
+    await session.exec(_owned(job.id, worker_id).values(locked_by=None, last_error=error, **values))
+    await session.commit()
+
+
+async def release(session: AsyncSession, job: Job, worker_id: str):
+    # Остановка воркера - не вина задания: попытку не засчитываем
+    await session.exec(_owned(job.id, worker_id).values(
+        status=JobStatus.QUEUED, attempts=Job.attempts - 1, locked_by=None, run_at=datetime.utcnow(),
+    ))
+    await session.commit()
+
+
+async def heartbeat(session: AsyncSession, job_ids: list[int], worker_id: str):
+    await session.exec(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.status == JobStatus.RUNNING, Job.locked_by == worker_id)
+        .values(heartbeat_at=datetime.utcnow())
+    )
+    await session.commit()
+
+
+async def reap(session: AsyncSession) -> int:
+    # Брошенные задания: исчерпавшие попытки - в failed, остальные - обратно в очередь
+    now = datetime.utcnow()
+    stale = [Job.status == JobStatus.RUNNING, Job.heartbeat_at < now - timedelta(seconds=JOB_LEASE)]
+    failed = await session.exec(
+        update(Job).where(*stale, Job.attempts >= Job.max_attempts)
+        .values(status=JobStatus.FAILED, finished_at=now, locked_by=None, last_error="Worker lost")
+        .returning(Job.id)
+    )
+    requeued = await session.exec(
+        update(Job).where(*stale)
+        .values(status=JobStatus.QUEUED, run_at=now, locked_by=None, last_error="Worker lost")
+        .returning(Job.id)
+    )
+    count = len(failed.all()) + len(requeued.all())
+    await session.commit()
+    return count
@@ -0,0 +1,52 @@
+# app/services/ledger.py
+from decimal import Decimal
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Transaction, User
+from app.services import rollups
+
+
+async def transfer(
+    session: AsyncSession,
+    family_id: int,
+    sender_id: int,
+    receiver_id: int,
+    amount: Decimal,
+    description: str,
+    kind: str,
+    interest: Decimal = Decimal("0.00"),
+    insufficient: str = "Not enough money",
+) -> Transaction:
+    # Обе строки блокируем заранее и по возрастанию id: встречные переводы
+    # (родитель -> ребёнок и ребёнок -> родитель) иначе берут их в разном
+    # порядке и ловят deadlock
+    await session.exec(
+        select(User.id).where(User.id.in_([sender_id, receiver_id])).order_by(User.id).with_for_update()
+    )
+
+    # Баланс меняется в самом UPDATE, а не read-modify-write в Python:
+    # параллельные переводы не затирают друг друга и не уводят в минус
+    debited = await session.exec(
+        update(User)
+        .where(User.id == sender_id, User.balance >= amount)
+        .values(balance=User.balance - amount)
+        .returning(User.id)
+    )
+    if debited.first() is None:
+        raise HTTPException(status_code=400, detail=insufficient)
+
+    await session.exec(update(User).where(User.id == receiver_id).values(balance=User.balance + amount))
+
+    transaction = Transaction(
+        family_id=family_id,
+        amount=amount,
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        description=description,
+    )
+    session.add(transaction)
+    await rollups.record(session, transaction, kind, interest=interest)
+    return transaction
@@ -1,13 +1,6 @@
-import os 
-from google import genai
+from app.core.timing import timed
+from app.services import gemini
 
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key) if api_key else None # <- укажи здесь свой api_key
-
-def ask_llm(prompt: str, model_name: str = "gemini-2.5-flash") -> str:
-    response = client.models.generate_content(
-        model=model_name,
-        contents=prompt
-    )
-
-    return response.text
+@timed("llm")
+async def ask_llm(prompt: str, model_name: str = "gemini-2.5-flash") -> str:
+    return await gemini.generate_content(prompt, model_name)
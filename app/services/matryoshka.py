@@ -0,0 +1,100 @@
+# app/services/matryoshka.py
+# Двухэтапный поиск на matryoshka-эмбеддингах gemini-embedding-001: первые
+# dim компонент вектора - тоже эмбеддинг, только грубее.
+#
+#   python -m app.services.matryoshka --dim 256                 # Flat по 256 измерениям
+#   python -m app.services.matryoshka --dim 128 --factory HNSW32
+#   python -m app.services.matryoshka --remove                  # обратно к одному этапу
+#
+# Рядом с index.faiss пишутся index.coarse.faiss (векторы, обрезанные до dim
+# и заново нормированные) и vectors.npy (полные 768-мерные векторы). search
+# ищет по грубому индексу top_k * RAG_COARSE_CANDIDATES кандидатов и точно
+# пересчитывает их скалярным произведением по vectors.npy, а index.faiss
+# тогда вообще не загружается.
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+
+from app.services.audience import all_vectors
+
+
+def coarse_path(data_dir: Path) -> Path:
+    return data_dir / "index.coarse.faiss"
+
+
+def vectors_path(data_dir: Path) -> Path:
+    return data_dir / "vectors.npy"
+
+
+def truncate(vectors: np.ndarray, dim: int) -> np.ndarray:
+    head = np.ascontiguousarray(vectors[:, :dim], dtype="float32")
+    norms = np.linalg.norm(head, axis=1, keepdims=True)
+    return head / np.maximum(norms, 1e-12)
+
+
+def rerank(full_vectors: np.ndarray, query_vector: np.ndarray, candidates: np.ndarray, top_k: int):
+    candidates = np.unique(candidates[candidates >= 0])
+    # unique заодно сортирует: строки из mmap читаются по возрастанию смещения
+    scores = full_vectors[candidates] @ query_vector[0]
+    order = np.argsort(-scores, kind="stable")[:top_k]
+
+    distances = np.full((1, top_k), -np.inf, dtype="float32")
+    indices = np.full((1, top_k), -1, dtype="int64")
+    distances[0, :len(order)] = scores[order]
+    indices[0, :len(order)] = candidates[order]
+    return distances, indices
+
+
+def build_coarse(vectors: np.ndarray, dim: int, factory: str = "Flat"):
+    import faiss
+
+    head = truncate(vectors, dim)
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(head[np.random.default_rng(0).permutation(len(head))[:50_000]])
+    index.add(head)
+    return index
+
+
+def build(data_dir: Path, dim: int, factory: str = "Flat") -> dict:
+    import faiss
+
+    full = faiss.read_index(str(data_dir / "index.faiss"))
+    if not 0 < dim < full.d:
+        raise ValueError(f"dim must be between 1 and {full.d - 1}")
+    vectors = np.ascontiguousarray(all_vectors(full), dtype="float32")
+
+    tmp = vectors_path(data_dir).with_name(f"vectors.{os.getpid()}.tmp.npy")
+    np.save(tmp, vectors)
+    os.replace(tmp, vectors_path(data_dir))
+
+    coarse = build_coarse(vectors, dim, factory)
+    tmp = coarse_path(data_dir).with_name(f"index.coarse.{os.getpid()}.tmp")
+    faiss.write_index(coarse, str(tmp))
+    os.replace(tmp, coarse_path(data_dir))
+
+    return {
+        "chunks": len(vectors),
+        "dim": dim,
+        "coarse_mb": round(coarse_path(data_dir).stat().st_size / 2**20, 1),
+        "full_mb": round((data_dir / "index.faiss").stat().st_size / 2**20, 1),
+    }
+
+
+if __name__ == "__main__":
+    from app.services.search import DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Грубый индекс по обрезанным эмбеддингам для двухэтапного поиска")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--factory", default="Flat", help="index_factory для грубого индекса")
+    parser.add_argument("--remove", action="store_true", help="удалить грубый индекс, искать в один этап")
+    args = parser.parse_args()
+
+    if args.remove:
+        coarse_path(args.data_dir).unlink(missing_ok=True)
+        vectors_path(args.data_dir).unlink(missing_ok=True)
+    else:
+        print(build(args.data_dir, args.dim, args.factory))
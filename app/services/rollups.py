@@ -0,0 +1,98 @@
+# app/services/rollups.py
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import DailyRollup, Transaction
+
+TASK_REWARD = "task_reward"
+LOAN_ISSUE = "loan_issue"
+LOAN_REPAY = "loan_repay"
+PAYOUT = "payout"
+
+AMOUNTS = ["inflow", "outflow", "task_rewards", "loan_principal", "loan_interest"]
+
+
+def _entry(user_id: int, transaction: Transaction, **amounts) -> dict:
+    row = {name: Decimal("0.00") for name in AMOUNTS}
+    row.update(amounts)
+    return {"user_id": user_id, "day": transaction.timestamp.date(), **row}
+
+
+async def record(session: AsyncSession, transaction: Transaction, kind: str, interest: Decimal = Decimal("0.00")):
+    # Один upsert на обе стороны перевода, в той же транзакции, что и деньги
+    receiver = {"inflow": transaction.amount}
+    if kind == TASK_REWARD:
+        receiver["task_rewards"] = transaction.amount
+    elif kind == LOAN_ISSUE:
+        receiver["loan_principal"] = transaction.amount
+
+    sender = {"outflow": transaction.amount}
+    if kind == LOAN_REPAY:
+        sender["loan_interest"] = interest
+
+    stmt = insert(DailyRollup).values([
+        _entry(transaction.receiver_id, transaction, **receiver),
+        _entry(transaction.sender_id, transaction, **sender),
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={name: getattr(DailyRollup, name) + getattr(stmt.excluded, name) for name in AMOUNTS},
+    )
+    await session.exec(stmt)
+
+
+# Суммы из истории переводов: для пересборки (миграция, seed.py) и сверки.
+# Вид перевода восстанавливается по описанию, проценты - по погашенному займу.
+# Фильтр по семье отсекает чужие секции loan; без него - для миграции 0002,
+# которая выполняется до того, как в transaction появляется family_id.
+def expected_sql(by_family: bool = True) -> str:
+    family_filter = "l.family_id = t.family_id AND " if by_family else ""
+    return f"""
+SELECT user_id, day, SUM(inflow) AS inflow, SUM(outflow) AS outflow, SUM(task_rewards) AS task_rewards,
+       SUM(loan_principal) AS loan_principal, SUM(loan_interest) AS loan_interest
+FROM (
+    SELECT t.receiver_id AS user_id, t.timestamp::date AS day,
+           t.amount AS inflow, 0 AS outflow,
+           CASE WHEN t.description LIKE 'Payment for task:%' THEN t.amount ELSE 0 END AS task_rewards,
+           CASE WHEN t.description LIKE 'Loan issued:%' THEN t.amount ELSE 0 END AS loan_principal,
+           0 AS loan_interest
+    FROM "transaction" t
+    UNION ALL
+    SELECT t.sender_id, t.timestamp::date,
+           0, t.amount, 0, 0,
+           CASE WHEN t.description LIKE 'Loan repaid:%' THEN t.amount - COALESCE((
+               SELECT l.amount FROM loan l
+               WHERE {family_filter}l.borrower_id = t.sender_id AND l.lender_id = t.receiver_id
+                 AND l.total_to_pay = t.amount AND l.status = 'PAID'
+               LIMIT 1
+           ), t.amount) ELSE 0 END
+    FROM "transaction" t
+) AS entries
+GROUP BY user_id, day
+"""
+
+
+EXPECTED_SQL = expected_sql()
+
+REBUILD_INSERT = "INSERT INTO dailyrollup (user_id, day, inflow, outflow, task_rewards, loan_principal, loan_interest)"
+
+# Строки dailyrollup, которые расходятся с пересчётом из истории (или отсутствуют)
+RECONCILE_SQL = f"""
+SELECT COALESCE(r.user_id, e.user_id) AS user_id, COALESCE(r.day, e.day) AS day,
+       r.inflow AS recorded_inflow, e.inflow AS expected_inflow,
+       r.outflow AS recorded_outflow, e.outflow AS expected_outflow
+FROM dailyrollup r
+FULL JOIN ({EXPECTED_SQL}) AS e ON e.user_id = r.user_id AND e.day = r.day
+WHERE r.user_id IS NULL OR e.user_id IS NULL
+   OR r.inflow <> e.inflow OR r.outflow <> e.outflow OR r.task_rewards <> e.task_rewards
+   OR r.loan_principal <> e.loan_principal OR r.loan_interest <> e.loan_interest
+ORDER BY 2, 1
+"""
+
+
+def rebuild(conn, by_family: bool = True):
+    conn.execute(text("DELETE FROM dailyrollup"))
+    conn.execute(text(f"{REBUILD_INSERT}\n{expected_sql(by_family)}"))
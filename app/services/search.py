@@ -1,34 +1,197 @@
-import json
+import asyncio
+import logging
+import os
+import threading
 from pathlib import Path
-import faiss
 import numpy as np
 
+from app.core import deadline, timing
+from app.services.audience import AUDIENCES, ids_path, index_path
+from app.services.chunk_store import load_chunks
+from app.services import matryoshka
 from app.services.server_embedder import embedder
 
+logger = logging.getLogger(__name__)
+
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-DATA_DIR = BASE_DIR / "data"
+DATA_DIR = Path(os.getenv("RAG_DATA_DIR", BASE_DIR / "data"))
 CHUNKS_JSON = DATA_DIR / "chunks.json"
 FAISS_INDEX = DATA_DIR / "index.faiss"
+# mmap: векторы индекса остаются в page cache и общие для всех воркеров
+INDEX_MMAP = os.getenv("RAG_INDEX_MMAP", "1") != "0"
+# Двухэтапный поиск включается, если собран index.coarse.faiss (app/services/matryoshka.py);
+# на точный пересчёт уходит top_k * COARSE_CANDIDATES кандидатов
+TWO_STAGE = os.getenv("RAG_TWO_STAGE", "1") != "0"
+COARSE_CANDIDATES = int(os.getenv("RAG_COARSE_CANDIDATES", "10"))
 
-with open(CHUNKS_JSON, "r", encoding="utf-8") as f:
-    chunks = json.load(f)
+# Индекс и чанки грузятся не при импорте, а в фоне из lifespan (или лениво
+# при первом поиске вне приложения): idle -> loading -> ready | failed
+status = "idle"
+error: str | None = None
+chunks = None
+index = None
+# Роль -> подындекс с номерами его чанков или фильтр по полному индексу;
+# роли без записи ищут по всему корпусу
+partitions: dict[str, dict] = {}
+# Полные векторы для второго этапа; None - index и есть полный индекс
+rerank_vectors: np.ndarray | None = None
+_lock = threading.Lock()
 
-index = faiss.read_index(str(FAISS_INDEX))
 
-def search(query: str, top_k: int = 5):
-    query_vector = embedder([query])[0].astype("float32")
-    query_vector = np.expand_dims(query_vector, axis=0)
+class SearchNotReady(Exception):
+    pass
+
+
+def _read_index(path: Path = FAISS_INDEX):
+    import faiss
+
+    if INDEX_MMAP:
+        try:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC)
+        except RuntimeError:
+            pass
+    return faiss.read_index(str(path))
+
+
+def selector_partition(full_index, ids: np.ndarray) -> dict:
+    import faiss
+
+    selector = faiss.IDSelectorBatch(ids)
+    try:
+        nprobe = faiss.extract_index_ivf(full_index).nprobe
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    except RuntimeError:
+        params = faiss.SearchParameters(sel=selector)
+    # selector держим рядом: params хранит на него только указатель
+    return {"index": None, "ids": ids, "params": params, "selector": selector}
 
-    distances, indices = index.search(query_vector, top_k)
 
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx < 0 or idx >= len(chunks):
+def _read_partitions(full_index, sub_indexes: bool = True) -> dict:
+    result = {}
+    for audience in AUDIENCES:
+        ids_file = ids_path(DATA_DIR, audience)
+        if not ids_file.exists():
             continue
-        chunk_data = chunks[idx]
-        chunk_data = chunk_data.copy()
-        chunk_data["score"] = float(dist)
-        results.append(chunk_data)
+        ids = np.load(ids_file)
+        sub_file = index_path(DATA_DIR, audience)
+        if sub_indexes and sub_file.exists():
+            result[audience] = {"index": _read_index(sub_file), "ids": ids}
+        else:
+            result[audience] = selector_partition(full_index, ids)
+    return result
+
+
+def _pretouch(path: Path, block: int = 4 << 20):
+    # Прочитанный файл оказывается в page cache, первые поиски не ждут диск
+    with open(path, "rb") as f:
+        while f.read(block):
+            pass
+
+
+def _read_two_stage():
+    coarse_file = matryoshka.coarse_path(DATA_DIR)
+    if not TWO_STAGE or not coarse_file.exists():
+        return None, None
+    # Полные векторы не прогреваются: второй этап читает только строки кандидатов
+    vectors = np.load(matryoshka.vectors_path(DATA_DIR), mmap_mode="r" if INDEX_MMAP else None)
+    return _read_index(coarse_file), vectors
+
+
+def _warmup(loaded_index, loaded_chunks, loaded_partitions, index_file: Path = FAISS_INDEX):
+    _pretouch(index_file)
+    for audience, part in loaded_partitions.items():
+        if part["index"] is not None:
+            _pretouch(index_path(DATA_DIR, audience))
+    blob_path = getattr(loaded_chunks, "blob_path", None)
+    if blob_path is not None:
+        _pretouch(blob_path)
+
+    probe = np.zeros((1, loaded_index.d), dtype="float32")
+    probe[0, 0] = 1.0
+    loaded_index.search(probe, 1)
+    if len(loaded_chunks):
+        loaded_chunks[0]
 
-    return results
 
+def load():
+    global status, error, chunks, index, partitions, rerank_vectors
+    with _lock:
+        if status == "ready":
+            return
+        status = "loading"
+        try:
+            loaded_chunks = load_chunks(CHUNKS_JSON)
+            loaded_index, loaded_vectors = _read_two_stage()
+            if loaded_index is None:
+                loaded_index = _read_index()
+                loaded_partitions = _read_partitions(loaded_index)
+                _warmup(loaded_index, loaded_chunks, loaded_partitions)
+            else:
+                # Подындексы ролей собраны по полным векторам, грубому индексу нужен фильтр
+                loaded_partitions = _read_partitions(loaded_index, sub_indexes=False)
+                _warmup(loaded_index, loaded_chunks, loaded_partitions, matryoshka.coarse_path(DATA_DIR))
+        except Exception as e:
+            status = "failed"
+            error = str(e)
+            logger.exception("RAG index failed to load from %s", DATA_DIR)
+            return
+        chunks, index, partitions = loaded_chunks, loaded_index, loaded_partitions
+        rerank_vectors = loaded_vectors
+        error = None
+        status = "ready"
+
+
+async def load_in_background():
+    await asyncio.to_thread(load)
+
+
+def _search_index(query_vector: np.ndarray, top_k: int, audience: str | None):
+    part = partitions.get(audience)
+    if part is None:
+        return index.search(query_vector, top_k)
+    if part["index"] is None:
+        return index.search(query_vector, top_k, params=part["params"])
+
+    # Подындекс нумерует свои векторы с нуля - переводим в номера чанков
+    distances, positions = part["index"].search(query_vector, top_k)
+    indices = np.where(positions >= 0, part["ids"][np.maximum(positions, 0)], -1)
+    return distances, indices
+
+
+def _search_vectors(query_vector: np.ndarray, top_k: int, audience: str | None):
+    if rerank_vectors is None:
+        return _search_index(query_vector, top_k, audience)
+
+    # Первый этап - широкая выборка по обрезанному вектору, второй - точный
+    # скалярный продукт по полным 768 измерениям только для неё
+    head = matryoshka.truncate(query_vector, index.d)
+    _, candidates = _search_index(head, top_k * COARSE_CANDIDATES, audience)
+    return matryoshka.rerank(rerank_vectors, query_vector, candidates[0], top_k)
+
+
+async def search(query: str, top_k: int = 5, audience: str | None = None):
+    if status == "idle":
+        await load_in_background()
+    if status != "ready":
+        raise SearchNotReady(error or "Search index is still loading")
+
+    query_vector = (await embedder([query]))[0].astype("float32")
+    query_vector = np.expand_dims(query_vector, axis=0)
+
+    # Эмбеддинг считается отдельной фазой "embed", здесь только FAISS
+    with timing.phase("search"):
+        # FAISS отпускает GIL, в пуле потоков поиск не блокирует event loop
+        distances, indices = await deadline.bounded(
+            asyncio.to_thread(_search_vectors, query_vector, top_k, audience), "search",
+        )
+
+        results = []
+        for dist, idx in zip(distances[0], indices[0]):
+            if idx < 0 or idx >= len(chunks):
+                continue
+            chunk_data = chunks[idx]
+            chunk_data = chunk_data.copy()
+            chunk_data["score"] = float(dist)
+            results.append(chunk_data)
+
+    return results
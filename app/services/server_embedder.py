@@ -1,25 +1,19 @@
-import os 
-from google import genai
-from google.genai import types
 import numpy as np
 
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key) if api_key else None # <- укажи свой api_key
+from app.core.timing import timed
+from app.services import gemini
 
-def embedder(texts: list[str]):
+@timed("embed")
+async def embedder(texts: list[str]):
     contents = [
         {"parts": [ {"text": t} ]}
         for t in texts
     ]
 
-    result = client.models.embed_content(
-        model="gemini-embedding-001",
-        contents=contents,
-        config=types.EmbedContentConfig(output_dimensionality=768)
-    )
+    embeddings = await gemini.embed_content(contents, dimensionality=768)
 
     vectors = []
-    for emb in result.embeddings:
+    for emb in embeddings:
         vec = np.array(emb.values, dtype="float32")
         vec = vec / np.linalg.norm(vec)
         vectors.append(vec)
@@ -0,0 +1,62 @@
+# app/services/transitions.py
+# Все допустимые переходы статусов задач и займов - здесь. Переход выполняется
+# одним условным UPDATE ... WHERE id = ? AND status IN (...) RETURNING, так что
+# два конкурентных запроса не могут оба перевести одну строку: второй получит 409.
+from fastapi import HTTPException
+from sqlalchemy import and_, select, true, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Loan, LoanStatus, Task, TaskStatus
+
+# действие -> (из каких статусов, в какой)
+TASK_TRANSITIONS = {
+    "submit": ({TaskStatus.NEW, TaskStatus.REJECTED}, TaskStatus.WAITING_APPROVAL),
+    "approve": ({TaskStatus.WAITING_APPROVAL}, TaskStatus.DONE),
+    "reject": ({TaskStatus.WAITING_APPROVAL}, TaskStatus.NEW),
+}
+
+LOAN_TRANSITIONS = {
+    "approve": ({LoanStatus.REQUESTED}, LoanStatus.ACTIVE),
+    "repay": ({LoanStatus.ACTIVE}, LoanStatus.PAID),
+    "reject": ({LoanStatus.REQUESTED}, LoanStatus.REJECTED),
+}
+
+TRANSITIONS = {Task: TASK_TRANSITIONS, Loan: LOAN_TRANSITIONS}
+
+
+async def transition(
+    session: AsyncSession,
+    model,
+    row_id: int,
+    family_id: int,
+    action: str,
+    guard=None,
+    forbidden: str = "Forbidden",
+    values: dict | None = None,
+    returning: list | None = None,
+):
+    # guard - условие доступа (чья это строка); values - что ещё записать вместе со статусом.
+    # family_id - ключ секционирования: с ним UPDATE читает одну секцию, а чужая
+    # семья получает 403, как и непрошедший guard
+    source, target = TRANSITIONS[model][action]
+    guard = and_(model.family_id == family_id, guard if guard is not None else true())
+
+    stmt = (
+        update(model)
+        .where(model.id == row_id, model.status.in_(source), guard)
+        .values(status=target, **(values or {}))
+        .returning(*(returning or [model.id]))
+    )
+    row = (await session.exec(stmt)).first()
+    if row is not None:
+        return row
+
+    # Ничего не обновили - выясняем почему; этот select только на пути ошибки
+    current = (await session.exec(select(model.status, guard).where(model.id == row_id))).first()
+    name = model.__name__
+    if current is None:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    status, allowed = current
+    if not allowed:
+        raise HTTPException(status_code=403, detail=forbidden)
+    raise HTTPException(status_code=409, detail=f"{name} is {status.value}, cannot {action}")
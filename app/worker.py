@@ -0,0 +1,152 @@
+# app/worker.py
+# Воркер фоновых заданий, запускается рядом с API:
+#
+#   python -m app.worker                                   # все типы
+#   python -m app.worker --types bulk_payout --max-jobs 8  # только выплаты
+#
+# Ограничение concurrency у типа общее для всех процессов (см. jobs.claim):
+# сколько бы воркеров ни запустили, rebuild_rollups выполняется один.
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+
+os.environ.setdefault("SQL_ECHO", "0")
+
+from app.database import async_session, engine
+from app.migrations import prepare_schema
+from app.services import jobs
+from app.services import job_handlers  # noqa: F401 - регистрирует типы заданий
+
+logger = logging.getLogger("app.worker")
+
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Сколько ждать выполняющиеся задания при остановке, потом они возвращаются в очередь
+SHUTDOWN_GRACE = float(os.getenv("JOB_SHUTDOWN_GRACE", "30"))
+
+
+class Worker:
+    def __init__(self, types: list[str], max_jobs: int):
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.types = types
+        self.max_jobs = max_jobs
+        # asyncio.Task -> (тип, Job)
+        self.running: dict[asyncio.Task, tuple] = {}
+        self.stopping = asyncio.Event()
+
+    def _free_types(self) -> list[str]:
+        if len(self.running) >= self.max_jobs:
+            return []
+        # Свои задания считаем, чтобы не ходить в базу зря; общий лимит проверит jobs.claim
+        busy = {}
+        for job_type, _ in self.running.values():
+            busy[job_type] = busy.get(job_type, 0) + 1
+        return [t for t in self.types if busy.get(t, 0) < jobs.JOB_TYPES[t].concurrency]
+
+    async def _execute(self, job):
+        spec = jobs.JOB_TYPES[job.type]
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(spec.handler(job), timeout=spec.timeout)
+        except asyncio.CancelledError:
+            async with async_session() as session:
+                await jobs.release(session, job, self.id)
+            raise
+        except Exception as e:
+            permanent = isinstance(e, jobs.PermanentError)
+            if isinstance(e, asyncio.TimeoutError):
+                error = f"Timed out after {spec.timeout}s"
+            else:
+                error = f"{type(e).__name__}: {e}"
+            logger.warning("job %s (%s) attempt %s failed: %s", job.id, job.type, job.attempts, error)
+            async with async_session() as session:
+                await jobs.fail(session, job, self.id, error, permanent=permanent)
+            return
+
+        async with async_session() as session:
+            await jobs.complete(session, job, self.id, result)
+        logger.info("job %s (%s) done in %.1fs", job.id, job.type, time.perf_counter() - started)
+
+    async def _claim_available(self) -> bool:
+        claimed = False
+        while not self.stopping.is_set():
+            types = self._free_types()
+            if not types:
+                break
+            async with async_session() as session:
+                job = await jobs.claim(session, types, self.id)
+            if job is None:
+                break
+            task = asyncio.create_task(self._execute(job))
+            self.running[task] = (job.type, job)
+            task.add_done_callback(self.running.pop)
+            claimed = True
+        return claimed
+
+    async def _housekeeping(self):
+        # Отметки о живых заданиях и подбор брошенных чужими воркерами
+        while not self.stopping.is_set():
+            try:
+                async with async_session() as session:
+                    ids = [job.id for _, job in self.running.values()]
+                    if ids:
+                        await jobs.heartbeat(session, ids, self.id)
+                    reaped = await jobs.reap(session)
+                if reaped:
+                    logger.warning("returned %s abandoned jobs to the queue", reaped)
+            except Exception:
+                logger.exception("job housekeeping failed")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=jobs.JOB_LEASE / 3)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        logger.info("worker %s: types %s, max %s jobs", self.id, self.types, self.max_jobs)
+        housekeeping = asyncio.create_task(self._housekeeping())
+        while not self.stopping.is_set():
+            try:
+                claimed = await self._claim_available()
+            except Exception:
+                logger.exception("claiming jobs failed")
+                claimed = False
+            if claimed:
+                continue
+            # Ждём освобождения слота, остановки или следующего опроса
+            waiters = [asyncio.create_task(self.stopping.wait())] + list(self.running)
+            await asyncio.wait(waiters, timeout=POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            waiters[0].cancel()
+
+        if self.running:
+            logger.info("waiting up to %ss for %s running jobs", SHUTDOWN_GRACE, len(self.running))
+            _, pending = await asyncio.wait(list(self.running), timeout=SHUTDOWN_GRACE)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await housekeeping
+
+
+async def main(types: list[str], max_jobs: int):
+    await prepare_schema(engine)
+    worker = Worker(types, max_jobs)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stopping.set)
+    try:
+        await worker.run()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BalaBank background job worker")
+    parser.add_argument("--types", nargs="+", default=sorted(jobs.JOB_TYPES), choices=sorted(jobs.JOB_TYPES))
+    parser.add_argument("--max-jobs", type=int, default=int(os.getenv("JOB_MAX_JOBS", "8")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main(args.types, args.max_jobs))
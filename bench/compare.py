@@ -0,0 +1,41 @@
+# bench/compare.py
+# Сравнивает два результата bench/load_test.py:
+#
+#   python -m bench.compare bench/results/load-A.json bench/results/load-B.json
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ["rps", "p50_ms", "p95_ms", "p99_ms", "db_statements_mean"]
+
+
+def delta(before, after) -> str:
+    if before is None or after is None:
+        return "-"
+    if before == 0:
+        return f"{after:.1f}"
+    return f"{after:.1f} ({(after - before) / before * 100:+.0f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+
+    before = json.loads(args.before.read_text())
+    after = json.loads(args.after.read_text())
+
+    print(f"throughput: {before['throughput_rps']:.1f} -> {delta(before['throughput_rps'], after['throughput_rps'])} req/s")
+    print(f"errors:     {before['errors']} -> {after['errors']}\n")
+
+    print(f"{'endpoint':<28}" + "".join(f"{m:>22}" for m in METRICS))
+    names = sorted(set(before["endpoints"]) | set(after["endpoints"]))
+    for name in names:
+        b = before["endpoints"].get(name, {})
+        a = after["endpoints"].get(name, {})
+        print(f"{name:<28}" + "".join(f"{delta(b.get(m), a.get(m)):>22}" for m in METRICS))
+
+
+if __name__ == "__main__":
+    main()
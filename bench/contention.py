@@ -0,0 +1,215 @@
+# bench/contention.py
+# Гонки за одни и те же строки: на каждую задачу в статусе waiting сразу летят
+# несколько approve и reject от родителя. Ровно один запрос должен выиграть,
+# остальные - получить 409 (или 400, если у родителя кончились деньги).
+# После прогона проверяются инварианты: не больше одной оплаты на задачу,
+# оплачены ровно задачи в done, деньги не появились и не пропали, балансы >= 0.
+#
+#   python -m bench.contention --families 20 --tasks 50 --racers 4 --concurrency 64
+#
+# Сравнить с другой ревизией: git worktree add /tmp/base <rev> и
+# --app-dir /tmp/base - сервер поднимется из того дерева, посев и проверки отсюда.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+import httpx
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.models import Task, TaskStatus, Transaction, User
+from bench.load_test import (
+    DEFAULT_DATABASE_URL, PASSWORD, RESULTS_DIR, git_revision, percentile, reset_and_seed, wait_until_up,
+)
+
+REWARD = Decimal("10.00")
+
+
+async def seed_tasks(database_url: str, families: list[dict], n_tasks: int, parent_balance: Decimal) -> list[dict]:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        parents = {phone: (uid, fid) for phone, uid, fid in (await conn.execute(
+            select(User.phone_number, User.id, User.family_id)
+            .where(User.phone_number.in_([f["parent_phone"] for f in families]))
+        )).all()}
+        # Денег хватает не на все задачи: заодно гонка за баланс
+        await conn.execute(
+            update(User).where(User.id.in_([uid for uid, _ in parents.values()])).values(balance=parent_balance)
+        )
+
+        rows = []
+        for family in families:
+            parent_id, family_id = parents[family["parent_phone"]]
+            for i in range(n_tasks):
+                rows.append({
+                    "title": f"race {family['child_id']}-{i}", "description": "bench", "reward": REWARD,
+                    "status": TaskStatus.WAITING_APPROVAL, "created_at": datetime.utcnow(),
+                    "child_id": family["child_id"], "creator_id": parent_id, "family_id": family_id,
+                })
+        task_ids = (await conn.execute(insert(Task).returning(Task.id), rows)).scalars().all()
+    await engine.dispose()
+
+    for family, start in zip(families, range(0, len(task_ids), n_tasks)):
+        family["task_ids"] = task_ids[start:start + n_tasks]
+    return families
+
+
+async def totals(database_url: str) -> dict:
+    engine = create_async_engine(database_url)
+    async with engine.connect() as conn:
+        balance_sum, negative = (await conn.execute(
+            select(func.sum(User.balance), func.count().filter(User.balance < 0))
+        )).one()
+        done = (await conn.execute(
+            select(func.count()).select_from(Task).where(Task.status == TaskStatus.DONE)
+        )).scalar_one()
+        payments = (await conn.execute(
+            select(Transaction.description, func.count()).group_by(Transaction.description)
+        )).all()
+    await engine.dispose()
+    return {
+        "balance_sum": balance_sum,
+        "negative_balances": negative,
+        "done": done,
+        "payments": sum(n for _, n in payments),
+        "double_payments": sum(1 for _, n in payments if n > 1),
+    }
+
+
+async def race(args, families: list[dict], base_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    gate = asyncio.Semaphore(args.concurrency)
+    samples = defaultdict(list)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        for family in families:
+            response = await client.post("/auth/login", data={"username": family["parent_phone"], "password": PASSWORD})
+            family["headers"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        async def call(action: str, task_id: int, headers: dict):
+            async with gate:
+                started = time.perf_counter()
+                try:
+                    status = (await client.post(f"/tasks/{task_id}/{action}", headers=headers)).status_code
+                except httpx.HTTPError:
+                    status = 0
+                samples[action].append((time.perf_counter() - started, status))
+
+        rng = random.Random(args.seed)
+        calls = []
+        for family in families:
+            for task_id in family["task_ids"]:
+                # racers запросов на одну задачу, примерно поровну approve и reject
+                for i in range(args.racers):
+                    action = "approve" if i % 2 == 0 or rng.random() < args.approve_share else "reject"
+                    calls.append(call(action, task_id, family["headers"]))
+        rng.shuffle(calls)
+
+        started = time.perf_counter()
+        await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - started
+
+    actions = {}
+    for action, values in sorted(samples.items()):
+        latencies = sorted(v[0] * 1000 for v in values)
+        actions[action] = {
+            "count": len(values),
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "statuses": dict(Counter(str(v[1]) for v in values)),
+        }
+    total = sum(a["count"] for a in actions.values())
+    return {"requests": total, "elapsed_s": elapsed, "throughput_rps": total / elapsed, "actions": actions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конкурентные approve/reject одних и тех же задач")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--families", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=50, help="задач в статусе waiting на семью")
+    parser.add_argument("--racers", type=int, default=4, help="одновременных запросов на одну задачу")
+    parser.add_argument("--approve-share", type=float, default=0.5)
+    parser.add_argument("--parent-balance", type=Decimal, default=Decimal("300.00"))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--app-dir", type=Path, default=None, help="чей app/ запускать (git worktree другой ревизии)")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    if "bench" not in (make_url(args.database_url).database or ""):
+        sys.exit("Refusing to run: the benchmark drops all tables, use a database whose name contains 'bench'")
+
+    families = asyncio.run(reset_and_seed(args.database_url, args.families))
+    families = asyncio.run(seed_tasks(args.database_url, families, args.tasks, args.parent_balance))
+    before = asyncio.run(totals(args.database_url))
+
+    env = {**os.environ, "DATABASE_URL": args.database_url, "GEMINI_API_KEY": "fake", "RATE_LIMIT_ENABLED": "0"}
+    app_dir = args.app_dir or Path.cwd()
+    env["PYTHONPATH"] = str(app_dir)
+    server = subprocess.Popen([sys.executable, "-m", "bench.server", "--port", str(args.port)], env=env, cwd=app_dir)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(wait_until_up(base_url + "/"))
+        report = asyncio.run(race(args, families, base_url))
+    finally:
+        server.terminate()
+        server.wait()
+
+    after = asyncio.run(totals(args.database_url))
+    approved = report["actions"].get("approve", {}).get("statuses", {}).get("200", 0)
+    violations = {
+        "double_payments": after["double_payments"],
+        "negative_balances": after["negative_balances"],
+        "money_changed": str(after["balance_sum"] - before["balance_sum"]),
+        # Каждая оплата - ровно одна задача в done и ровно один успешный approve
+        "payments_vs_done": after["payments"] - after["done"],
+        "payments_vs_approved": after["payments"] - approved,
+    }
+    ok = all(v in (0, "0.00") for v in violations.values())
+
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision() if args.app_dir is None else str(args.app_dir),
+            "families": args.families,
+            "tasks_per_family": args.tasks,
+            "racers": args.racers,
+            "concurrency": args.concurrency,
+            "parent_balance": str(args.parent_balance),
+        },
+        **report,
+        "done": after["done"],
+        "violations": violations,
+        "ok": ok,
+    }
+
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        suffix = f"-{args.label}" if args.label else ""
+        output = RESULTS_DIR / f"contention-{datetime.utcnow():%Y%m%d-%H%M%S}{suffix}.json"
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    for action, a in report["actions"].items():
+        print(f"{action:<8}{a['count']:>7}{a['p50_ms']:>9.1f}{a['p95_ms']:>9.1f}{a['p99_ms']:>9.1f}  {a['statuses']}")
+    print(f"\nthroughput: {report['throughput_rps']:.1f} req/s, tasks done: {after['done']}")
+    print(f"invariants: {'ok' if ok else 'VIOLATED'} {violations}")
+    print(f"saved to {output}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/fake_gemini.py
+# Локальная замена Gemini API для нагрузочных тестов: отвечает в формате
+# generativelanguage.googleapis.com, но с детерминированными эмбеддингами и
+# настраиваемой задержкой.
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+DIM = 768
+GENERATE_LATENCY = float(os.getenv("FAKE_GEMINI_GENERATE_MS", "800")) / 1000
+EMBED_LATENCY = float(os.getenv("FAKE_GEMINI_EMBED_MS", "60")) / 1000
+# Доля ответов 503 и доля ответов в 10 раз медленнее обычного:
+# для проверки circuit breaker и хеджирования
+FAILURE_RATE = float(os.getenv("FAKE_GEMINI_FAILURE_RATE", "0"))
+SLOW_RATE = float(os.getenv("FAKE_GEMINI_SLOW_RATE", "0"))
+
+
+async def _latency(base: float):
+    await asyncio.sleep(base * 10 if random.random() < SLOW_RATE else base)
+
+
+def fake_vector(text: str, dim: int = DIM) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return vec / np.linalg.norm(vec)
+
+
+def _text_of(content: dict) -> str:
+    parts = content.get("parts") or [{}]
+    return "".join(p.get("text", "") for p in parts)
+
+
+async def model_call(request: Request):
+    model, _, method = request.path_params["call"].partition(":")
+    body = await request.json()
+
+    if random.random() < FAILURE_RATE:
+        return JSONResponse({"error": {"code": 503, "message": "Injected failure", "status": "UNAVAILABLE"}}, status_code=503)
+
+    if method == "generateContent":
+        await _latency(GENERATE_LATENCY)
+        prompt = _text_of((body.get("contents") or [{}])[0])
+        return JSONResponse({
+            "candidates": [{
+                "content": {
+                    "role": "model",
+                    "parts": [{"text": f"[{model}] Ответ на запрос длиной {len(prompt)} символов."}],
+                },
+                "finishReason": "STOP",
+            }],
+        })
+
+    if method == "batchEmbedContents":
+        await _latency(EMBED_LATENCY)
+        embeddings = []
+        for req in body.get("requests", []):
+            dim = req.get("outputDimensionality") or DIM
+            vec = fake_vector(_text_of(req.get("content", {})), dim)
+            embeddings.append({"values": vec.tolist()})
+        return JSONResponse({"embeddings": embeddings})
+
+    return JSONResponse({"error": {"code": 404, "message": f"Unknown method {method}"}}, status_code=404)
+
+
+app = Starlette(routes=[
+    Route("/{version}/models/{call}", model_call, methods=["POST"]),
+])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,333 @@
+# bench/partitions.py
+# Секционирование task/loan/transaction по family_id: запросы одной семьи к
+# секционированным таблицам против тех же данных в обычных таблицах. Работает
+# по базе, засеянной seed.py; заметно на десятках миллионов строк:
+#
+#   DATABASE_URL=... python seed.py --reset --scale 20
+#   python -m bench.partitions --database-url ... --families 300
+#
+# При первом запуске рядом создаются несекционированные копии (task_heap,
+# loan_heap, transaction_heap) с индексами, как были до секционирования;
+# --drop-heap удаляет их после прогона. Каждый запрос выполняется в трёх видах:
+#   heap     - старые таблицы и старый запрос (у задач и переводов нет family_id)
+#   unpruned - секционированные таблицы, но запрос без условия на family_id:
+#              Postgres обходит все секции
+#   pruned   - как пишет приложение сейчас: с family_id читается одна секция
+# --maintenance добавляет время VACUUM и REINDEX обычной таблицы и одной секции.
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.models import FAMILY_PARTITIONS, Loan, Task, Transaction
+from bench.load_test import DEFAULT_DATABASE_URL, RESULTS_DIR, git_revision, percentile
+
+PAGE = 50
+LIVE_TASKS = "status IN ('NEW', 'WAITING_APPROVAL')"
+
+# Колонки, которых не было до секционирования
+ADDED_COLUMNS = {"task": {"family_id"}, "transaction": {"family_id"}, "loan": set()}
+
+# имя -> {вид: SQL}; :parent, :child, :family, :members (id членов семьи), :task - из sample_families
+QUERIES = {
+    "tasks_parent_page": {
+        "heap": f"SELECT * FROM task_heap WHERE creator_id = :parent ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+        "unpruned": f"SELECT * FROM task WHERE creator_id = :parent ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+        "pruned": f"SELECT * FROM task WHERE family_id = :family AND creator_id = :parent "
+                  f"ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+    },
+    "tasks_child_live": {
+        "heap": f"SELECT * FROM task_heap WHERE child_id = :child AND {LIVE_TASKS} "
+                f"ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+        "unpruned": f"SELECT * FROM task WHERE child_id = :child AND {LIVE_TASKS} "
+                    f"ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+        "pruned": f"SELECT * FROM task WHERE family_id = :family AND child_id = :child AND {LIVE_TASKS} "
+                  f"ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+    },
+    "task_counts": {
+        "heap": "SELECT status, count(*) FROM task_heap WHERE creator_id = :parent GROUP BY status",
+        "unpruned": "SELECT status, count(*) FROM task WHERE creator_id = :parent GROUP BY status",
+        "pruned": "SELECT status, count(*) FROM task WHERE family_id = :family AND creator_id = :parent GROUP BY status",
+    },
+    # Поиск строки перед переходом статуса (UPDATE ... WHERE id = ?)
+    "task_by_id": {
+        "heap": "SELECT status FROM task_heap WHERE id = :task",
+        "unpruned": "SELECT status FROM task WHERE id = :task",
+        "pruned": "SELECT status FROM task WHERE family_id = :family AND id = :task",
+    },
+    # У займов family_id был и раньше: разница только в секциях
+    "loans_family_page": {
+        "heap": f"SELECT * FROM loan_heap WHERE family_id = :family ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+        "pruned": f"SELECT * FROM loan WHERE family_id = :family ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+    },
+    # Выгрузка переводов семьи: раньше - по списку её членов
+    "export_family": {
+        "heap": "SELECT * FROM transaction_heap WHERE sender_id = ANY(:members) OR receiver_id = ANY(:members) "
+                "ORDER BY timestamp, id",
+        "unpruned": 'SELECT * FROM "transaction" WHERE sender_id = ANY(:members) OR receiver_id = ANY(:members) '
+                    "ORDER BY timestamp, id",
+        "pruned": 'SELECT * FROM "transaction" WHERE family_id = :family ORDER BY timestamp, id',
+    },
+}
+
+
+
+def _numbered(sql: str) -> tuple[str, list[str]]:
+    # :name -> $n для asyncpg; возвращает и порядок имён
+    names = []
+
+    def number(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    return re.sub(r"(?<!:):(\w+)", number, sql), names
+
+
+def _heap_ddl(table) -> list[str]:
+    name = table.name
+    heap = f"{name}_heap"
+    columns = [c.name for c in table.columns if c.name not in ADDED_COLUMNS[name]]
+    ddl = [
+        f'CREATE TABLE "{heap}" AS SELECT {", ".join(columns)} FROM "{name}" ORDER BY id',
+        f'ALTER TABLE "{heap}" ADD PRIMARY KEY (id)',
+    ]
+    for index in table.indexes:
+        index_columns = [c.name for c in index.columns]
+        if ADDED_COLUMNS[name] & set(index_columns):
+            continue
+        where = index.dialect_options["postgresql"]["where"]
+        ddl.append(
+            f'CREATE INDEX "{index.name}_heap" ON "{heap}" ({", ".join(index_columns)})'
+            + (f" WHERE {where.text}" if where is not None else "")
+        )
+    ddl.append(f'ANALYZE "{heap}"')
+    return ddl
+
+
+async def ensure_heap_copies(conn: asyncpg.Connection):
+    for table in (Task.__table__, Loan.__table__, Transaction.__table__):
+        heap = f"{table.name}_heap"
+        if await conn.fetchval("SELECT to_regclass($1)", heap) is not None:
+            continue
+        started = time.perf_counter()
+        for statement in _heap_ddl(table):
+            await conn.execute(statement)
+        print(f"created {heap} in {time.perf_counter() - started:.0f}s")
+
+
+async def sizes(conn: asyncpg.Connection) -> dict:
+    # Размер таблицы с индексами и самой большой секции
+    result = {}
+    for name in ("task", "loan", "transaction"):
+        partitions = await conn.fetch(
+            "SELECT pg_total_relation_size(inhrelid) AS bytes, pg_indexes_size(inhrelid) AS index_bytes "
+            "FROM pg_inherits WHERE inhparent = to_regclass($1)",
+            f'"{name}"',
+        )
+        heap = await conn.fetchrow(
+            "SELECT pg_total_relation_size(to_regclass($1)) AS bytes, pg_indexes_size(to_regclass($1)) AS index_bytes",
+            f"{name}_heap",
+        )
+        result[name] = {
+            "rows": await conn.fetchval('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass($1)', f"{name}_heap"),
+            "heap_mb": heap["bytes"] / 2**20,
+            "heap_index_mb": heap["index_bytes"] / 2**20,
+            "partitions": len(partitions),
+            "largest_partition_mb": max(p["bytes"] for p in partitions) / 2**20,
+            "largest_partition_index_mb": max(p["index_bytes"] for p in partitions) / 2**20,
+        }
+    return result
+
+
+async def sample_families(conn: asyncpg.Connection, n: int, seed: int) -> list[dict]:
+    max_id = await conn.fetchval("SELECT max(id) FROM family")
+    rng = random.Random(seed)
+    families = []
+    while len(families) < n:
+        family_id = rng.randint(1, max_id)
+        members = await conn.fetch('SELECT id, role::text FROM "user" WHERE family_id = $1 ORDER BY id', family_id)
+        parents = [m["id"] for m in members if m["role"] == "PARENT"]
+        children = [m["id"] for m in members if m["role"] == "CHILD"]
+        task_id = await conn.fetchval("SELECT id FROM task WHERE family_id = $1 ORDER BY id LIMIT 1", family_id)
+        if not parents or not children or task_id is None:
+            continue
+        families.append({
+            "family": family_id, "parent": parents[0], "child": rng.choice(children),
+            "members": [m["id"] for m in members], "task": task_id,
+        })
+    return families
+
+
+async def maintenance(conn: asyncpg.Connection) -> dict:
+    # Обслуживание (autovacuum, перестройка индексов) идёт по одной секции:
+    # время на обычной таблице против самой большой секции
+    result = {}
+    for name in ("task", "loan", "transaction"):
+        partition = await conn.fetchval(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass($1) "
+            "ORDER BY pg_total_relation_size(inhrelid) DESC LIMIT 1",
+            f'"{name}"',
+        )
+        result[name] = {}
+        for variant, relation in (("heap", f'"{name}_heap"'), ("partition", partition)):
+            timings = {}
+            for operation in ("VACUUM (ANALYZE, DISABLE_PAGE_SKIPPING)", "REINDEX TABLE"):
+                started = time.perf_counter()
+                await conn.execute(f"{operation} {relation}")
+                timings[operation.split()[0].lower() + "_s"] = time.perf_counter() - started
+            result[name][variant] = timings
+    return result
+
+
+def _plan_stats(plan: dict) -> tuple[int, set]:
+    # Буферы всего запроса и таблицы/секции, которые он реально читал
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node and node.get("Actual Loops", 1) > 0:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan["Plan"])
+    buffers = plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0)
+    return buffers, relations
+
+
+async def run_query(conn: asyncpg.Connection, sql: str, families: list[dict], explain_every: int) -> dict:
+    sql, names = _numbered(sql)
+    statement = await conn.prepare(sql)
+    explain = await conn.prepare(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+    latencies, buffers, relations, rows = [], [], [], 0
+    for i, family in enumerate(families):
+        args = [family[name] for name in names]
+        started = time.perf_counter()
+        result = await statement.fetch(*args)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rows += len(result)
+        if i % explain_every == 0:
+            [plan] = json.loads(await explain.fetchval(*args))
+            plan_buffers, plan_relations = _plan_stats(plan)
+            buffers.append(plan_buffers)
+            relations.append(len(plan_relations))
+    latencies.sort()
+    return {
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_buffers": sum(buffers) / len(buffers),
+        "relations_read": max(relations),
+        "rows": rows / len(families),
+    }
+
+
+async def bench(args) -> dict:
+    url = make_url(args.database_url)
+    conn = await asyncpg.connect(
+        host=url.query.get("host", url.host), port=url.port, user=url.username,
+        password=url.password, database=url.database,
+    )
+    try:
+        if await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('task')") != "p":
+            sys.exit("task is not partitioned: seed the database with the current seed.py or start the app to migrate it")
+        await ensure_heap_copies(conn)
+        families = await sample_families(conn, args.families, args.seed)
+
+        # Прогрев: все виды по разу, чтобы ни один не получил кэш за счёт другого
+        for variants in QUERIES.values():
+            for sql in variants.values():
+                await run_query(conn, sql, families, explain_every=len(families))
+
+        queries = {}
+        for name, variants in QUERIES.items():
+            if args.queries and name not in args.queries:
+                continue
+            queries[name] = {}
+            for _ in range(args.rounds):
+                # Виды по очереди в каждом раунде, итог - лучший раунд
+                for variant, sql in variants.items():
+                    stats = await run_query(conn, sql, families, args.explain_every)
+                    best = queries[name].get(variant)
+                    if best is None or stats["p50_ms"] < best["p50_ms"]:
+                        queries[name][variant] = stats
+
+        table_sizes = await sizes(conn)
+        maintenance_times = await maintenance(conn) if args.maintenance else None
+        if args.drop_heap:
+            for name in ("task", "loan", "transaction"):
+                await conn.execute(f'DROP TABLE IF EXISTS "{name}_heap"')
+    finally:
+        await conn.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "database": url.database,
+            "partitions": FAMILY_PARTITIONS,
+            "families": args.families,
+            "rounds": args.rounds,
+        },
+        "sizes": table_sizes,
+        "queries": queries,
+        "maintenance": maintenance_times,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Family-partitioned tables vs plain tables")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--families", type=int, default=300, help="sampled families, each query runs once per family")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--explain-every", type=int, default=10, help="EXPLAIN ANALYZE every n-th run for buffer counts")
+    parser.add_argument("--queries", nargs="+", choices=sorted(QUERIES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--maintenance", action="store_true", help="also time VACUUM and REINDEX: plain table vs one partition")
+    parser.add_argument("--drop-heap", action="store_true", help="drop the plain copies afterwards")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    result = asyncio.run(bench(args))
+
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        suffix = f"-{args.label}" if args.label else ""
+        output = RESULTS_DIR / f"partitions-{datetime.utcnow():%Y%m%d-%H%M%S}{suffix}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    for name, s in result["sizes"].items():
+        print(
+            f"{name:<12}{s['rows']:>12} rows  plain {s['heap_mb']:>8.0f} MB (indexes {s['heap_index_mb']:.0f})  "
+            f"largest of {s['partitions']} partitions {s['largest_partition_mb']:.0f} MB "
+            f"(indexes {s['largest_partition_index_mb']:.0f})"
+        )
+    print(f"\n{'query':<20}{'variant':<10}{'p50':>9}{'p95':>9}{'p99':>9}{'buffers':>9}{'tables':>8}{'rows':>8}")
+    for name, variants in result["queries"].items():
+        for variant, q in variants.items():
+            print(
+                f"{name:<20}{variant:<10}{q['p50_ms']:>9.3f}{q['p95_ms']:>9.3f}{q['p99_ms']:>9.3f}"
+                f"{q['mean_buffers']:>9.1f}{q['relations_read']:>8}{q['rows']:>8.1f}"
+            )
+    if result["maintenance"]:
+        print(f"\n{'table':<14}{'vacuum plain':>14}{'partition':>11}{'reindex plain':>15}{'partition':>11}")
+        for name, m in result["maintenance"].items():
+            print(
+                f"{name:<14}{m['heap']['vacuum_s']:>13.1f}s{m['partition']['vacuum_s']:>10.1f}s"
+                f"{m['heap']['reindex_s']:>14.1f}s{m['partition']['reindex_s']:>10.1f}s"
+            )
+    print(f"\nsaved to {output}")
+
+
+if __name__ == "__main__":
+    main()
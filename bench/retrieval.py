@@ -0,0 +1,388 @@
+# bench/retrieval.py
+# Качество и скорость поиска для /ask: прогоняет версионированный набор
+# вопросов с разметкой (bench/queries/*.jsonl) через search.search на разных
+# конфигурациях FAISS-индекса и считает recall@k, MRR, совпадение с точным
+# поиском и перцентили задержки. Эмбеддинги вопросов берутся из кэша, так что
+# Gemini нужен только один раз, при --embed.
+#
+#   python -m bench.retrieval --embed                         # один раз, с GEMINI_API_KEY
+#   python -m bench.retrieval --configs current "HNSW32|efSearch=64" "IVF256,Flat|nprobe=8"
+#   python -m bench.retrieval --synthetic 50000               # без data/, на синтетике
+#   python -m bench.retrieval --gate bench/results/retrieval-base.json
+#   python -m bench.retrieval --synthetic 50000 --audience subindex  # поиск с фильтром по роли
+#   python -m bench.retrieval --configs current Flat@256 Flat@128 "HNSW32@128|efSearch=64"  # двухэтапный
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.services import matryoshka, search
+from app.services.audience import AUDIENCES, all_vectors, subset_index, tag_chunk
+from app.services.chunk_store import load_chunks
+from bench.fake_gemini import fake_vector
+from bench.load_test import RESULTS_DIR, git_revision, percentile, prepare_rag_data
+
+QUERIES_DIR = Path(__file__).resolve().parent / "queries"
+DEFAULT_QUERY_SET = "v1"
+DEFAULT_CONFIGS = ["current", "HNSW32|efSearch=64", "IVF256,Flat|nprobe=8", "Flat@256"]
+DIM = 768
+
+# Метрики качества, падение которых --gate считает регрессией
+METRIC_KEYS = ["recall", "mrr", "ann_recall"]
+
+
+def load_query_set(name: str) -> list[dict]:
+    path = QUERIES_DIR / f"{name}.jsonl"
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def query_set_digest(queries: list[dict]) -> str:
+    # Кэш эмбеддингов годен, пока не поменялись сами вопросы
+    raw = "\n".join(f"{q['id']}\t{q['query']}" for q in queries) + f"\n{DIM}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def embeddings_path(name: str) -> Path:
+    return QUERIES_DIR / f"{name}.npz"
+
+
+async def embed_queries(queries: list[dict], batch: int = 100) -> np.ndarray:
+    from app.services.server_embedder import embedder
+
+    vectors = []
+    for start in range(0, len(queries), batch):
+        vectors.extend(await embedder([q["query"] for q in queries[start:start + batch]]))
+    return np.stack(vectors).astype("float32")
+
+
+def load_embeddings(name: str, queries: list[dict]) -> np.ndarray:
+    path = embeddings_path(name)
+    if not path.exists():
+        sys.exit(f"No cached embeddings at {path}: run once with --embed (needs GEMINI_API_KEY) or use --fake-embeddings")
+    cached = np.load(path)
+    if str(cached["digest"]) != query_set_digest(queries):
+        sys.exit(f"{path} is stale for query set {name!r}: rerun with --embed")
+    return cached["vectors"]
+
+
+def synthetic_queries(vectors: np.ndarray, tags: list[list[str]], n_queries: int, seed: int) -> tuple[list[dict], np.ndarray]:
+    # Вопрос - зашумлённый вектор чанка, релевантен сам этот чанк;
+    # задаёт его тот, кому чанк виден
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    noise = rng.standard_normal((len(ids), vectors.shape[1])).astype("float32")
+    noise /= np.linalg.norm(noise, axis=1, keepdims=True)
+    query_vectors = vectors[ids] + 0.8 * noise
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    queries = [
+        {"id": f"s{i}", "role": tags[cid][i % len(tags[cid])], "query": f"synthetic {i}", "relevant_ids": [int(cid)]}
+        for i, cid in enumerate(ids)
+    ]
+    return queries, query_vectors
+
+
+def build_index(spec: str, vectors: np.ndarray, current):
+    # Возвращает индекс и полные векторы для второго этапа (None - поиск в один этап)
+    factory, _, params = spec.partition("|")
+    factory, _, dim = factory.partition("@")
+    rerank = None
+    if dim:
+        # factory@dim: грубый индекс по первым dim компонентам + точный пересчёт
+        index = matryoshka.build_coarse(vectors, int(dim), factory)
+        rerank = vectors
+    elif factory == "current":
+        index = current
+    else:
+        index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            sample = vectors[np.random.default_rng(0).permutation(len(vectors))[:50_000]]
+            index.train(sample)
+        index.add(vectors)
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+    return index, rerank
+
+
+def audience_ids(tags: list[list[str]]) -> dict[str, np.ndarray]:
+    # Только роли, которым виден не весь корпус
+    result = {}
+    for audience in AUDIENCES:
+        ids = np.array([i for i, t in enumerate(tags) if audience in t], dtype="int64")
+        if len(ids) < len(tags):
+            result[audience] = ids
+    return result
+
+
+def exact_neighbors(vectors: np.ndarray, queries: list[dict], query_vectors: np.ndarray, k: int, allowed: dict) -> np.ndarray:
+    # Эталон для ann_recall: точный поиск по тому же подмножеству, что видит роль
+    result = np.full((len(queries), k), -1, dtype="int64")
+    groups = {}
+    for i, query in enumerate(queries):
+        groups.setdefault(query.get("role") if query.get("role") in allowed else None, []).append(i)
+    for audience, rows in groups.items():
+        ids = allowed[audience] if audience is not None else np.arange(len(vectors))
+        exact = faiss.IndexFlatIP(vectors.shape[1])
+        exact.add(vectors[ids])
+        _, positions = exact.search(query_vectors[rows], k)
+        result[rows] = np.where(positions >= 0, ids[np.maximum(positions, 0)], -1)
+    return result
+
+
+def build_partitions(mode: str, index, vectors: np.ndarray, allowed: dict) -> dict:
+    if mode == "subindex":
+        return {a: {"index": subset_index(index, vectors, ids), "ids": ids} for a, ids in allowed.items()}
+    if mode == "selector":
+        return {a: search.selector_partition(index, ids) for a, ids in allowed.items()}
+    return {}
+
+
+def is_relevant(query: dict, chunk: dict) -> bool:
+    if chunk.get("id") in query.get("relevant_ids", ()):
+        return True
+    text = chunk.get("text", "").lower()
+    return any(phrase in text for phrase in query.get("relevant_text", ()))
+
+
+def summarize(rows: list[dict], top_ks: list[int]) -> dict:
+    latencies = sorted(ms for row in rows for ms in row["latencies"])
+    labeled = [row for row in rows if row["ranks"] is not None]
+    result = {
+        "queries": len(rows),
+        # Сколько символов контекста уйдёт в промпт
+        "context_chars": float(np.mean([row["context_chars"] for row in rows])),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+    for k in top_ks:
+        result[f"ann_recall@{k}"] = float(np.mean([row["overlap"][k] for row in rows]))
+        if labeled:
+            # recall@k: доля вопросов, у которых релевантный чанк попал в top-k
+            result[f"recall@{k}"] = float(np.mean([row["ranks"] <= k for row in labeled]))
+    if labeled:
+        result["mrr"] = float(np.mean([1 / row["ranks"] if row["ranks"] != np.inf else 0.0 for row in labeled]))
+    return result
+
+
+async def evaluate(
+    index, rerank, partitions: dict, exact_ids: np.ndarray, queries: list[dict], vectors: np.ndarray, top_ks: list[int], repeat: int,
+) -> dict:
+    by_text = {q["query"]: v for q, v in zip(queries, vectors)}
+
+    async def cached_embedder(texts: list[str]):
+        return [by_text[t] for t in texts]
+
+    search.embedder = cached_embedder
+    search.index = index
+    search.rerank_vectors = rerank
+    search.partitions = partitions
+    search.status = "ready"
+
+    max_k = max(top_ks)
+    rows = []
+    for i, query in enumerate(queries):
+        audience = query.get("role") if partitions else None
+        await search.search(query["query"], top_k=max_k, audience=audience)
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = await search.search(query["query"], top_k=max_k, audience=audience)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        # У чанков может не быть id, сравниваем по тексту
+        found = [r["text"] for r in results]
+        labeled = "relevant_ids" in query or "relevant_text" in query
+        ranks = next((rank for rank, r in enumerate(results, 1) if is_relevant(query, r)), np.inf) if labeled else None
+        exact = [search.chunks[j]["text"] for j in exact_ids[i] if j >= 0]
+        overlap = {k: len(set(found[:k]) & set(exact[:k])) / k for k in top_ks}
+        rows.append({
+            "role": query.get("role"),
+            "latencies": latencies,
+            "ranks": ranks,
+            "overlap": overlap,
+            "context_chars": sum(len(text) for text in found),
+        })
+
+    report = summarize(rows, top_ks)
+    report["by_role"] = {
+        role: summarize([row for row in rows if row["role"] == role], top_ks)
+        for role in sorted({row["role"] for row in rows if row["role"]})
+    }
+    return report
+
+
+def gate(baseline: dict, configs: dict, max_metric_drop: float, max_p95_increase: float) -> list[str]:
+    failures = []
+    for spec, current in configs.items():
+        before = baseline["configs"].get(spec)
+        if before is None:
+            continue
+        for name, value in current["metrics"].items():
+            if name == "by_role" or not any(name.startswith(m) for m in METRIC_KEYS):
+                continue
+            old = before["metrics"].get(name)
+            if old is not None and old - value > max_metric_drop:
+                failures.append(f"{spec}: {name} {old:.3f} -> {value:.3f}")
+        old_p95, p95 = before["metrics"]["p95_ms"], current["metrics"]["p95_ms"]
+        if old_p95 and (p95 - old_p95) / old_p95 > max_p95_increase:
+            failures.append(f"{spec}: p95 {old_p95:.2f} ms -> {p95:.2f} ms")
+    return failures
+
+
+def _cells(metrics: dict, before: dict, columns: list[str]) -> str:
+    cells = []
+    for c in columns:
+        value = metrics.get(c)
+        if value is None:
+            cells.append(f"{'-':>16}")
+        elif c in before:
+            cells.append(f"{value:.3f}({value - before[c]:+.3f})".rjust(16))
+        else:
+            cells.append(f"{value:>16.3f}")
+    return "".join(cells)
+
+
+def print_report(configs: dict, top_ks: list[int], baseline: dict | None):
+    columns = (
+        [f"recall@{k}" for k in top_ks] + ["mrr"] + [f"ann_recall@{k}" for k in top_ks]
+        + ["context_chars", "p50_ms", "p95_ms", "p99_ms"]
+    )
+    print(f"{'config':<28}{'build_s':>9}{'size_mb':>9}" + "".join(f"{c:>16}" for c in columns))
+    for spec, run in configs.items():
+        before = (baseline or {}).get("configs", {}).get(spec, {}).get("metrics", {})
+        print(f"{spec:<28}{run['build_s']:>9.1f}{run['size_mb']:>9.1f}" + _cells(run["metrics"], before, columns))
+        for role, metrics in run["metrics"]["by_role"].items():
+            role_before = before.get("by_role", {}).get(role, {})
+            print(f"{'  ' + role:<46}" + _cells(metrics, role_before, columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency across FAISS index configurations")
+    parser.add_argument("--query-set", default=DEFAULT_QUERY_SET)
+    parser.add_argument("--data-dir", type=Path, default=search.DATA_DIR)
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS, help='"current" или index_factory[|параметры]')
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого вопроса для перцентилей")
+    parser.add_argument("--embed", action="store_true", help="посчитать эмбеддинги вопросов через Gemini и сохранить")
+    parser.add_argument("--fake-embeddings", action="store_true", help="детерминированные эмбеддинги вместо кэша")
+    parser.add_argument("--synthetic", type=int, default=0, help="синтетический корпус из N чанков вместо data/")
+    parser.add_argument("--synthetic-queries", type=int, default=300)
+    parser.add_argument(
+        "--audience", choices=["none", "subindex", "selector"], default="none",
+        help="искать с фильтром по роли вопроса: подындексы или IDSelector по полному индексу",
+    )
+    parser.add_argument(
+        "--coarse-candidates", type=int, default=search.COARSE_CANDIDATES,
+        help="для factory@dim: сколько кандидатов на top_k уходит на точный пересчёт",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--gate", type=Path, default=None, help="базовый отчёт; при регрессии код выхода 1")
+    parser.add_argument("--max-metric-drop", type=float, default=0.02)
+    parser.add_argument("--max-p95-increase", type=float, default=0.25)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    if args.embed:
+        queries = load_query_set(args.query_set)
+        vectors = asyncio.run(embed_queries(queries))
+        np.savez(embeddings_path(args.query_set), vectors=vectors, digest=query_set_digest(queries))
+        print(f"saved {len(vectors)} embeddings to {embeddings_path(args.query_set)}")
+        return
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = Path(tempfile.mkdtemp(prefix="balabank-retrieval-"))
+        prepare_rag_data(data_dir, args.synthetic, args.seed)
+
+    current = faiss.read_index(str(data_dir / "index.faiss"))
+    search.chunks = load_chunks(data_dir / "chunks.json")
+    vectors = all_vectors(current)
+    tags = [tag_chunk(search.chunks[i]) for i in range(len(search.chunks))]
+    allowed = audience_ids(tags) if args.audience != "none" else {}
+
+    if args.synthetic:
+        query_set = f"synthetic-{args.synthetic}"
+        queries, query_vectors = synthetic_queries(vectors, tags, args.synthetic_queries, args.seed)
+        embeddings = "synthetic"
+    else:
+        query_set = args.query_set
+        queries = load_query_set(args.query_set)
+        if args.fake_embeddings:
+            query_vectors = np.stack([fake_vector(q["query"], vectors.shape[1]) for q in queries])
+            embeddings = "fake"
+        else:
+            query_vectors = load_embeddings(args.query_set, queries)
+            embeddings = "cached"
+
+    search.COARSE_CANDIDATES = args.coarse_candidates
+    exact_ids = exact_neighbors(vectors, queries, query_vectors, max(args.top_k), allowed)
+
+    configs = {}
+    for spec in args.configs:
+        started = time.perf_counter()
+        index, rerank = build_index(spec, vectors, current)
+        # Как в search.load: в двухэтапном режиме роли фильтруются селектором по грубому индексу
+        mode = "selector" if rerank is not None and args.audience == "subindex" else args.audience
+        partitions = build_partitions(mode, index, vectors, allowed)
+        build_s = time.perf_counter() - started
+        metrics = asyncio.run(evaluate(index, rerank, partitions, exact_ids, queries, query_vectors, args.top_k, args.repeat))
+        configs[spec] = {
+            "build_s": build_s,
+            "size_mb": sum(
+                len(faiss.serialize_index(i)) for i in [index] + [p["index"] for p in partitions.values() if p.get("index")]
+            ) / 2**20,
+            # Полные векторы второго этапа: mmap, в память читаются только строки кандидатов
+            "rerank_mb": rerank.nbytes / 2**20 if rerank is not None else 0.0,
+            "metrics": metrics,
+        }
+
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "query_set": query_set,
+            "query_set_digest": query_set_digest(queries),
+            "embeddings": embeddings,
+            "audience": args.audience,
+            "audience_chunks": {a: len(ids) for a, ids in allowed.items()},
+            "corpus_chunks": int(current.ntotal),
+            "data_dir": str(data_dir),
+            "top_k": args.top_k,
+            "repeat": args.repeat,
+            "coarse_candidates": args.coarse_candidates,
+        },
+        "configs": configs,
+    }
+
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"retrieval-{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    baseline = json.loads(args.gate.read_text()) if args.gate else None
+    if baseline and baseline["meta"]["query_set_digest"] != result["meta"]["query_set_digest"]:
+        sys.exit("Baseline was measured on a different query set, refusing to compare")
+
+    print_report(configs, args.top_k, baseline)
+    print(f"saved to {output}")
+
+    if baseline:
+        failures = gate(baseline, configs, args.max_metric_drop, args.max_p95_increase)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+# bench/server.py
+# Запускает API для нагрузочного теста без echo SQL. Число запросов к БД
+# клиент берёт из заголовка X-DB-Statements (app/core/sqlstats.py).
+import argparse
+import os
+
+os.environ.setdefault("SQL_ECHO", "0")
+
+import uvicorn
+
+from app.main import app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,165 @@
+# bench/workers.py
+# Масштабирование по числу воркеров gunicorn: для каждого значения --workers
+# поднимает gunicorn.conf.py (preload + mmap-индекс), гоняет ту же смесь
+# сценариев, что и load_test, и снимает память каждого воркера из
+# /proc/<pid>/smaps_rollup. Pss делит общие страницы между процессами, так
+# что сумма Pss по воркерам - честная цена N воркеров.
+#
+#   python -m bench.workers --workers 1 2 4 --chunks 50000
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+from bench.load_test import (
+    DEFAULT_DATABASE_URL,
+    RESULTS_DIR,
+    drive,
+    git_revision,
+    prepare_rag_data,
+    reset_and_seed,
+    wait_until_up,
+)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def children_of(pid: int) -> list[int]:
+    result = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # поле ppid идёт после "(comm)", а comm может содержать пробелы
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == pid:
+            result.append(int(entry.name))
+    return sorted(result)
+
+
+def memory_of(pid: int) -> dict:
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value, *_ = line.split()
+        fields[name.rstrip(":")] = int(value)
+    return {
+        "rss_mb": fields.get("Rss", 0) / 1024,
+        "pss_mb": fields.get("Pss", 0) / 1024,
+        "shared_mb": (fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024,
+        "private_mb": (fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024,
+    }
+
+
+def run_one(args, n_workers: int, families: list[dict], env: dict) -> dict:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        cwd=ROOT_DIR,
+        env={**env, "WEB_CONCURRENCY": str(n_workers), "BIND": f"127.0.0.1:{args.port}"},
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(wait_until_up(base_url + "/"))
+        report = asyncio.run(drive(args, families, base_url))
+        workers = [memory_of(pid) for pid in children_of(process.pid)]
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "workers": n_workers,
+        "throughput_rps": report["throughput_rps"],
+        "errors": report["errors"],
+        "memory_per_worker": workers,
+        "pss_total_mb": sum(w["pss_mb"] for w in workers),
+        "rss_total_mb": sum(w["rss_mb"] for w in workers),
+        "endpoints": report["endpoints"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory per gunicorn worker count")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--families", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--gemini-port", type=int, default=8890)
+    parser.add_argument("--no-mmap", action="store_true", help="грузить индекс в память каждого воркера")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    if "bench" not in (make_url(args.database_url).database or ""):
+        sys.exit("Refusing to run: the benchmark drops all tables, use a database whose name contains 'bench'")
+
+    families = asyncio.run(reset_and_seed(args.database_url, args.families))
+    data_dir = Path(tempfile.mkdtemp(prefix="balabank-bench-"))
+    prepare_rag_data(data_dir, args.chunks, args.seed)
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "GEMINI_API_KEY": "fake",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{args.gemini_port}",
+        "RAG_DATA_DIR": str(data_dir),
+        "RAG_INDEX_MMAP": "0" if args.no_mmap else "1",
+        "RATE_LIMIT_ENABLED": "0",
+        "SQL_ECHO": "0",
+    }
+    fake_gemini = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_gemini", "--port", str(args.gemini_port)], env=env,
+    )
+    try:
+        runs = [run_one(args, n, families, env) for n in args.workers]
+    finally:
+        fake_gemini.terminate()
+        fake_gemini.wait()
+
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "families": args.families,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "chunks": args.chunks,
+            "index_mmap": not args.no_mmap,
+        },
+        "runs": runs,
+    }
+
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"workers-{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    base = runs[0]["throughput_rps"] / runs[0]["workers"] if runs and runs[0]["throughput_rps"] else None
+    print(f"{'workers':>8}{'rps':>10}{'scaling':>9}{'rss/w':>9}{'pss/w':>9}{'shared/w':>10}{'pss sum':>9}")
+    for run in runs:
+        n = run["workers"]
+        per_worker = run["memory_per_worker"] or [{"rss_mb": 0, "pss_mb": 0, "shared_mb": 0}]
+        avg = {k: sum(w[k] for w in per_worker) / len(per_worker) for k in ("rss_mb", "pss_mb", "shared_mb")}
+        scaling = f"{run['throughput_rps'] / base:.2f}x" if base else "-"
+        print(
+            f"{n:>8}{run['throughput_rps']:>10.1f}{scaling:>9}{avg['rss_mb']:>9.0f}"
+            f"{avg['pss_mb']:>9.0f}{avg['shared_mb']:>10.0f}{run['pss_total_mb']:>9.0f}"
+        )
+    print(f"saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
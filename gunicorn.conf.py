@@ -0,0 +1,23 @@
+# gunicorn -c gunicorn.conf.py app.main:app
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Код приложения импортируется в мастере до fork, воркеры получают эти страницы
+# copy-on-write. Индекс и чанки каждый воркер открывает сам через mmap, так что
+# они тоже общие - через page cache.
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+
+def pre_fork(server, worker):
+    # Объекты, созданные при импорте, больше не трогает сборщик мусора,
+    # и их страницы не копируются в каждый воркер
+    gc.freeze()
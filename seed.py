@@ -1,77 +1,353 @@
+# Генератор синтетических данных.
+#
+#   python seed.py --reset                 # демо-аккаунты + 10 000 семей
+#   python seed.py --reset --scale 100     # ~1 млн семей, десятки млн задач
+#
+# Таблицы создаются без индексов и внешних ключей, данные заливаются через
+# COPY, индексы и ограничения строятся уже после загрузки.
+import argparse
 import asyncio
-from sqlmodel import select
-from app.database import async_session, engine
-from app.models import User, Family, UserRole
-from app.core.security import get_password_hash
+from datetime import datetime
 from decimal import Decimal
 
-async def seed_data():
-    print("🌱 Начинаем посев данных...")
-    
-    async with async_session() as session:
-        family_stark = Family(name="Семья Старков", invite_code="winter")
-        session.add(family_stark)
-        await session.commit()
-        await session.refresh(family_stark)
-        print(f"✅ Семья {family_stark.name} создана (id={family_stark.id})")
-
-        ned = User(
-            phone_number="+996555111111",
-            hashed_password=get_password_hash("123"),
-            surname="Старк", name="Нед", paternity="Рикардович", age=45,
-            role=UserRole.PARENT,
-            family_id=family_stark.id,
-            balance=Decimal("10000.00")
-        )
-        arya = User(
-            phone_number="+996555222222",
-            hashed_password=get_password_hash("123"),
-            surname="Старк", name="Арья", paternity="Недовна", age=14,
-            role=UserRole.CHILD,
-            family_id=family_stark.id,
-            balance=Decimal("0.00")
-        )
-        
-        family_lannister = Family(name="Семья Ланнистеров", invite_code="gold")
-        session.add(family_lannister)
-        await session.commit()
-        await session.refresh(family_lannister)
-        print(f"✅ Семья {family_lannister.name} создана (id={family_lannister.id})")
-
-        tywin = User(
-            phone_number="+996777888888",
-            hashed_password=get_password_hash("123"),
-            surname="Ланнистер", name="Тайвин", paternity="Титосович", age=60,
-            role=UserRole.PARENT,
-            family_id=family_lannister.id,
-            balance=Decimal("10000.00")
-        )
-        tyrion = User(
-            phone_number="+996777999999",
-            hashed_password=get_password_hash("123"),
-            surname="Ланнистер", name="Тирион", paternity="Тайвинович", age=16,
-            role=UserRole.CHILD,
-            family_id=family_lannister.id,
-            balance=Decimal("500.00")
-        )
-
-        session.add(ned)
-        session.add(arya)
-        session.add(tywin)
-        session.add(tyrion)
-        
-        await session.commit()
-        print("🚀 Все пользователи успешно добавлены!")
-        print("------------------------------------------------")
-        print("Данные для входа (Пароль везде: 123):")
-        print("1. Нед Старк (Папа): +996555111111")
-        print("2. Арья Старк (Дочь): +996555222222")
-        print("3. Тайвин (Папа):    +996777888888")
-        print("4. Тирион (Сын):     +996777999999")
-
-async def main():
-    await seed_data()
+import numpy as np
+from sqlalchemy import Enum as SAEnum, inspect, text
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
+from sqlmodel import SQLModel
+from tqdm import tqdm
+
+from app.database import engine
+from app.migrations import mark_all_applied
+from app.models import TaskStatus, LoanStatus, UserRole, create_family_partitions
+from app.core.security import get_password_hash
+from app.services import rollups
+
+FAMILIES_PER_SCALE = 10_000
+BATCH_FAMILIES = 5_000
+HISTORY_DAYS = 730
+
+PASSWORD = "123"
+
+PARENTS_PER_FAMILY = ([1, 2], [0.7, 0.3])
+CHILDREN_PER_FAMILY = ([1, 2, 3, 4], [0.35, 0.4, 0.18, 0.07])
+TASKS_PER_CHILD = 30
+LOANS_PER_CHILD = 3
+
+TASK_STATUSES = (
+    [TaskStatus.DONE, TaskStatus.NEW, TaskStatus.WAITING_APPROVAL, TaskStatus.REJECTED],
+    [0.72, 0.1, 0.06, 0.12],
+)
+LOAN_STATUSES = (
+    [LoanStatus.PAID, LoanStatus.ACTIVE, LoanStatus.REQUESTED, LoanStatus.REJECTED],
+    [0.6, 0.15, 0.1, 0.15],
+)
+INTEREST_RATES = [0, 5, 10, 15, 20]
+
+SURNAMES = ["Асанов", "Бакиров", "Жумабаев", "Иманалиев", "Кадыров", "Осмонов", "Садыков", "Токтогулов"]
+PARENT_NAMES = ["Азамат", "Айбек", "Нурлан", "Айгуль", "Жылдыз", "Гульнара", "Бакыт", "Чолпон"]
+CHILD_NAMES = ["Алишер", "Адина", "Эмир", "Айлин", "Нурислам", "Амина", "Данияр", "Сафия"]
+TASK_TITLES = ["Убрать комнату", "Помыть посуду", "Сделать уроки", "Выгулять собаку", "Полить цветы", "Вынести мусор"]
+LOAN_PURPOSES = ["Велосипед", "Наушники", "Подарок маме", "Кроссовки", "Книга", "Игра"]
+
+# Демо-аккаунты из старого seed.py, чтобы ими можно было войти как раньше
+DEMO_FAMILIES = [
+    (1, "Семья Старков", "winter"),
+    (2, "Семья Ланнистеров", "gold"),
+]
+DEMO_USERS = [
+    (1, "+996555111111", "Старк", "Нед", "Рикардович", 45, UserRole.PARENT, 1, Decimal("10000.00")),
+    (2, "+996555222222", "Старк", "Арья", "Недовна", 14, UserRole.CHILD, 1, Decimal("0.00")),
+    (3, "+996777888888", "Ланнистер", "Тайвин", "Титосович", 60, UserRole.PARENT, 2, Decimal("10000.00")),
+    (4, "+996777999999", "Ланнистер", "Тирион", "Тайвинович", 16, UserRole.CHILD, 2, Decimal("500.00")),
+]
+
+FAMILY_COLUMNS = ["id", "name", "invite_code"]
+USER_COLUMNS = ["id", "phone_number", "hashed_password", "surname", "name", "paternity", "age", "role", "family_id", "balance"]
+TASK_COLUMNS = ["id", "title", "description", "reward", "status", "created_at", "child_id", "creator_id", "family_id"]
+LOAN_COLUMNS = ["id", "amount", "interest_rate", "total_to_pay", "description", "created_at", "due_date", "status", "borrower_id", "lender_id", "family_id"]
+TRANSACTION_COLUMNS = ["id", "amount", "description", "timestamp", "sender_id", "receiver_id", "family_id"]
+
+
+def money(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def create_bare_tables(sync_conn, reset: bool):
+    existing = set(inspect(sync_conn).get_table_names())
+    if existing and not reset:
+        raise SystemExit(f"Tables already exist ({', '.join(sorted(existing))}), rerun with --reset to drop them")
+    SQLModel.metadata.drop_all(sync_conn)
+
+    for table in SQLModel.metadata.sorted_tables:
+        for column in table.columns:
+            if isinstance(column.type, SAEnum):
+                column.type.create(sync_conn, checkfirst=True)
+        sync_conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+        if table.dialect_options["postgresql"]["partition_by"]:
+            create_family_partitions(table, sync_conn)
+
+
+def create_indexes_and_constraints(sync_conn):
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            sync_conn.execute(CreateIndex(index))
+    for table in SQLModel.metadata.sorted_tables:
+        for constraint in table.foreign_key_constraints:
+            sync_conn.execute(AddConstraint(constraint))
+
+
+class Generator:
+    def __init__(self, seed: int, as_of: datetime):
+        self.rng = np.random.default_rng(seed)
+        self.as_of = np.datetime64(as_of, "us")
+        self.hashed_password = get_password_hash(PASSWORD)
+
+        self.next_family_id = len(DEMO_FAMILIES) + 1
+        self.next_user_id = len(DEMO_USERS) + 1
+        self.next_task_id = 1
+        self.next_loan_id = 1
+        self.next_transaction_id = 1
+
+        self.counts = {"family": len(DEMO_FAMILIES), "user": len(DEMO_USERS), "task": 0, "loan": 0, "transaction": 0}
+
+    def _ago(self, days: np.ndarray) -> np.ndarray:
+        return self.as_of - (days * 86_400e6).astype("timedelta64[us]")
+
+    def _later(self, moments: np.ndarray, days: np.ndarray) -> np.ndarray:
+        return np.minimum(moments + (days * 86_400e6).astype("timedelta64[us]"), self.as_of)
+
+    def _ids(self, attr: str, n: int) -> np.ndarray:
+        first = getattr(self, attr)
+        setattr(self, attr, first + n)
+        return np.arange(first, first + n)
+
+    def batch(self, n_families: int) -> dict:
+        rng = self.rng
+
+        family_ids = self._ids("next_family_id", n_families)
+        n_parents = rng.choice(PARENTS_PER_FAMILY[0], n_families, p=PARENTS_PER_FAMILY[1])
+        n_children = rng.choice(CHILDREN_PER_FAMILY[0], n_families, p=CHILDREN_PER_FAMILY[1])
+        sizes = n_parents + n_children
+
+        n_users = int(sizes.sum())
+        user_ids = self._ids("next_user_id", n_users)
+        offsets = np.cumsum(sizes) - sizes
+        user_family = np.repeat(family_ids, sizes)
+        position = np.arange(n_users) - np.repeat(offsets, sizes)
+        is_parent = position < np.repeat(n_parents, sizes)
+
+        ages = np.where(is_parent, rng.integers(25, 60, n_users), rng.integers(6, 18, n_users))
+        surnames = rng.integers(0, len(SURNAMES), n_families)
+        first_names = rng.integers(0, len(PARENT_NAMES), n_users)
+
+        # Каждому ребёнку - родитель, который ставит задачи и выдаёт займы
+        child_idx = np.flatnonzero(~is_parent)
+        child_family = np.searchsorted(family_ids, user_family[child_idx])
+        parent_idx = offsets[child_family] + rng.integers(0, n_parents[child_family])
+
+        inflow = np.zeros(n_users, dtype=np.int64)
+        outflow = np.zeros(n_users, dtype=np.int64)
+
+        # Задачи
+        tasks_per_child = rng.negative_binomial(2, 2 / (2 + TASKS_PER_CHILD), len(child_idx))
+        n_tasks = int(tasks_per_child.sum())
+        task_ids = self._ids("next_task_id", n_tasks)
+        task_child = np.repeat(child_idx, tasks_per_child)
+        task_parent = np.repeat(parent_idx, tasks_per_child)
+        task_status = rng.choice(len(TASK_STATUSES[0]), n_tasks, p=TASK_STATUSES[1])
+        live = (task_status == 1) | (task_status == 2)
+        task_days = np.where(live, rng.uniform(0, 14, n_tasks), HISTORY_DAYS * rng.beta(1, 2, n_tasks))
+        task_created = self._ago(task_days)
+        task_reward = np.maximum(1, np.round(rng.lognormal(np.log(10), 0.6, n_tasks))).astype(np.int64) * 1000
+        task_title = rng.integers(0, len(TASK_TITLES), n_tasks)
+
+        done = task_status == 0
+        np.add.at(inflow, task_child[done], task_reward[done])
+        np.add.at(outflow, task_parent[done], task_reward[done])
+        paid_at = self._later(task_created[done], rng.uniform(0.1, 3, int(done.sum())))
+
+        # Займы
+        loans_per_child = rng.poisson(LOANS_PER_CHILD, len(child_idx))
+        n_loans = int(loans_per_child.sum())
+        loan_ids = self._ids("next_loan_id", n_loans)
+        loan_child = np.repeat(child_idx, loans_per_child)
+        loan_parent = np.repeat(parent_idx, loans_per_child)
+        loan_status = rng.choice(len(LOAN_STATUSES[0]), n_loans, p=LOAN_STATUSES[1])
+        loan_days = np.where(loan_status == 2, rng.uniform(0, 7, n_loans), HISTORY_DAYS * rng.beta(1, 2, n_loans))
+        loan_created = self._ago(loan_days)
+        loan_amount = np.maximum(1, np.round(rng.lognormal(np.log(10), 0.7, n_loans))).astype(np.int64) * 5000
+        loan_rate = rng.choice(INTEREST_RATES, n_loans)
+        loan_total = loan_amount + loan_amount * loan_rate // 100
+        loan_purpose = rng.integers(0, len(LOAN_PURPOSES), n_loans)
+
+        issued = (loan_status == 0) | (loan_status == 1)
+        repaid = loan_status == 0
+        issued_at = self._later(loan_created[issued], rng.uniform(0.1, 2, int(issued.sum())))
+        due_dates = loan_created + np.timedelta64(30, "D")
+        repaid_at = self._later(loan_created[repaid], rng.uniform(3, 30, int(repaid.sum())))
+
+        np.add.at(inflow, loan_child[issued], loan_amount[issued])
+        np.add.at(outflow, loan_parent[issued], loan_amount[issued])
+        np.add.at(inflow, loan_parent[repaid], loan_total[repaid])
+        np.add.at(outflow, loan_child[repaid], loan_total[repaid])
+
+        start_balance = np.where(is_parent, 1_000_000, 0)
+        balance = np.clip(start_balance + inflow - outflow, 0, 9_999_999_999)
+
+        families = [
+            (int(fid), f"Семья {SURNAMES[s]}ых", f"f{fid:x}")
+            for fid, s in zip(family_ids, surnames)
+        ]
+
+        user_surnames = np.repeat(surnames, sizes)
+        users = []
+        for i in range(n_users):
+            uid = int(user_ids[i])
+            names = PARENT_NAMES if is_parent[i] else CHILD_NAMES
+            users.append((
+                uid, f"+996{200_000_000 + uid}", self.hashed_password,
+                SURNAMES[user_surnames[i]], names[first_names[i]], "-", int(ages[i]),
+                (UserRole.PARENT if is_parent[i] else UserRole.CHILD).name,
+                int(user_family[i]), money(balance[i]),
+            ))
+
+        task_created_list = task_created.tolist()
+        tasks = [
+            (
+                int(task_ids[i]), TASK_TITLES[task_title[i]], None, money(task_reward[i]),
+                TASK_STATUSES[0][task_status[i]].name, task_created_list[i],
+                int(user_ids[task_child[i]]), int(user_ids[task_parent[i]]),
+                int(user_family[task_child[i]]),
+            )
+            for i in range(n_tasks)
+        ]
+
+        loan_created_list = loan_created.tolist()
+        due_list = due_dates.tolist()
+        loans = [
+            (
+                int(loan_ids[i]), money(loan_amount[i]), Decimal(int(loan_rate[i])), money(loan_total[i]),
+                LOAN_PURPOSES[loan_purpose[i]], loan_created_list[i],
+                due_list[i] if issued[i] else None, LOAN_STATUSES[0][loan_status[i]].name,
+                int(user_ids[loan_child[i]]), int(user_ids[loan_parent[i]]) if issued[i] else None,
+                int(user_family[loan_child[i]]),
+            )
+            for i in range(n_loans)
+        ]
+
+        transactions = []
+        for i, at in zip(np.flatnonzero(done), paid_at.tolist()):
+            transactions.append((
+                money(task_reward[i]), f"Payment for task: {TASK_TITLES[task_title[i]]}", at,
+                int(user_ids[task_parent[i]]), int(user_ids[task_child[i]]),
+                int(user_family[task_child[i]]),
+            ))
+        for i, at in zip(np.flatnonzero(issued), issued_at.tolist()):
+            transactions.append((
+                money(loan_amount[i]), f"Loan issued: {LOAN_PURPOSES[loan_purpose[i]]}", at,
+                int(user_ids[loan_parent[i]]), int(user_ids[loan_child[i]]),
+                int(user_family[loan_child[i]]),
+            ))
+        for i, at in zip(np.flatnonzero(repaid), repaid_at.tolist()):
+            transactions.append((
+                money(loan_total[i]), f"Loan repaid: {LOAN_PURPOSES[loan_purpose[i]]}", at,
+                int(user_ids[loan_child[i]]), int(user_ids[loan_parent[i]]),
+                int(user_family[loan_child[i]]),
+            ))
+        transaction_ids = self._ids("next_transaction_id", len(transactions))
+        transactions = [(int(tid), *row) for tid, row in zip(transaction_ids, transactions)]
+
+        self.counts["family"] += len(families)
+        self.counts["user"] += len(users)
+        self.counts["task"] += len(tasks)
+        self.counts["loan"] += len(loans)
+        self.counts["transaction"] += len(transactions)
+
+        return {"family": families, "user": users, "task": tasks, "loan": loans, "transaction": transactions}
+
+
+COLUMNS = {
+    "family": FAMILY_COLUMNS,
+    "user": USER_COLUMNS,
+    "task": TASK_COLUMNS,
+    "loan": LOAN_COLUMNS,
+    "transaction": TRANSACTION_COLUMNS,
+}
+
+
+async def copy_rows(raw, rows_by_table: dict):
+    for table, rows in rows_by_table.items():
+        if rows:
+            await raw.copy_records_to_table(table, records=rows, columns=COLUMNS[table])
+
+
+async def seed_data(scale: float, seed: int, reset: bool, as_of: datetime):
+    n_families = int(FAMILIES_PER_SCALE * scale)
+    generator = Generator(seed, as_of)
+
+    print(f"🌱 Генерируем {n_families} семей (scale={scale}, seed={seed})...")
+
+    async with engine.connect() as conn:
+        await conn.run_sync(create_bare_tables, reset)
+        await conn.commit()
+
+        raw = (await conn.get_raw_connection()).driver_connection
+
+        demo_users = [
+            (uid, phone, generator.hashed_password, surname, name, paternity, age, role.name, family_id, balance)
+            for uid, phone, surname, name, paternity, age, role, family_id, balance in DEMO_USERS
+        ]
+        await copy_rows(raw, {"family": DEMO_FAMILIES, "user": demo_users})
+
+        with tqdm(total=n_families, unit="fam") as progress:
+            for start in range(0, n_families, BATCH_FAMILIES):
+                n = min(BATCH_FAMILIES, n_families - start)
+                await copy_rows(raw, generator.batch(n))
+                progress.update(n)
+
+        print("🔧 Строим индексы и внешние ключи...")
+        await conn.run_sync(create_indexes_and_constraints)
+        for table in SQLModel.metadata.sorted_tables:
+            if "id" in table.columns and table.columns["id"].autoincrement is not False:
+                name = table.name
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{name}\"', 'id'), "
+                    f"GREATEST(MAX(id), 1), MAX(id) IS NOT NULL) FROM \"{name}\""
+                ))
+        await conn.commit()
+
+        print("📊 Считаем дневные итоги...")
+        await conn.run_sync(rollups.rebuild)
+        await conn.run_sync(mark_all_applied)
+        await conn.commit()
+
+        await conn.execute(text("ANALYZE"))
+        await conn.commit()
+
+    print("🚀 Готово:", ", ".join(f"{table}={count}" for table, count in generator.counts.items()))
+    print("------------------------------------------------")
+    print(f"Данные для входа (Пароль везде: {PASSWORD}):")
+    print("1. Нед Старк (Папа): +996555111111")
+    print("2. Арья Старк (Дочь): +996555222222")
+    print("3. Тайвин (Папа):    +996777888888")
+    print("4. Тирион (Сын):     +996777999999")
+    print("Синтетические пользователи: +996 и (200000000 + id), например +996200000005")
+
+
+async def main(args):
+    await seed_data(args.scale, args.seed, args.reset, args.as_of)
     await engine.dispose()
 
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Заполнить базу синтетическими данными")
+    parser.add_argument("--scale", type=float, default=1.0, help=f"1.0 = {FAMILIES_PER_SCALE} семей")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="удалить существующие таблицы")
+    parser.add_argument(
+        "--as-of",
+        type=datetime.fromisoformat,
+        default=datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+        help="дата, относительно которой строится история (по умолчанию сегодня)",
+    )
+    asyncio.run(main(parser.parse_args()))
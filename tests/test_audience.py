@@ -0,0 +1,28 @@
+# tests/test_audience.py
+# Эвристика взрослых тем: основы слов ловятся только с начала слова.
+import pytest
+
+from app.services.audience import AUDIENCES, auto_tags
+
+
+@pytest.mark.parametrize("text", [
+    "Каждая транзакция видна в истории",
+    "Реакция банка на перевод",
+    "Вакцина от необдуманных трат",
+    "Копилка - аналог сейфа",
+    "Компенсация за потерянную карту",
+])
+def test_everyday_words_stay_visible_to_children(text):
+    assert auto_tags({"text": text}) == list(AUDIENCES)
+
+
+@pytest.mark.parametrize("text", [
+    "Акции и облигации",
+    "Сколько стоит одна акция",
+    "Дивиденды по акциям",
+    "Налоговый вычет за обучение",
+    "Как копить на пенсию",
+    "Потребительский кредит",
+])
+def test_adult_topics_are_parent_only(text):
+    assert auto_tags({"text": text}) == ["parent"]
@@ -0,0 +1,137 @@
+# tests/test_migrations.py
+# prepare_schema на базе со схемой и данными исходной версии (до
+# schema_migration): все миграции должны пройти по порядку.
+#
+#   DATABASE_URL=postgresql+asyncpg://... python -m pytest -q tests
+#
+# Создаёт и удаляет временную базу на том же сервере; без сервера - пропуск.
+import asyncio
+import os
+import uuid
+from decimal import Decimal
+
+os.environ.setdefault("SQL_ECHO", "0")
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import DATABASE_URL
+from app.migrations import MIGRATIONS, prepare_schema
+from app.services import rollups
+
+# Схема, которую create_all строил до первой миграции
+BASELINE_SCHEMA = """
+CREATE TYPE userrole AS ENUM ('PARENT', 'CHILD');
+CREATE TYPE taskstatus AS ENUM ('NEW', 'WAITING_APPROVAL', 'DONE', 'REJECTED');
+CREATE TYPE loanstatus AS ENUM ('REQUESTED', 'ACTIVE', 'PAID', 'REJECTED');
+CREATE TYPE requeststatus AS ENUM ('PENDING', 'APPROVED', 'REJECTED');
+CREATE TABLE family (
+    id SERIAL NOT NULL, name VARCHAR NOT NULL, invite_code VARCHAR NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_family_invite_code ON family (invite_code);
+CREATE TABLE "transaction" (
+    id SERIAL NOT NULL, amount NUMERIC(10, 2), description VARCHAR NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL, sender_id INTEGER NOT NULL, receiver_id INTEGER NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE TABLE "user" (
+    id SERIAL NOT NULL, phone_number VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL,
+    surname VARCHAR NOT NULL, name VARCHAR NOT NULL, paternity VARCHAR NOT NULL, age INTEGER NOT NULL,
+    role userrole, family_id INTEGER, balance NUMERIC(10, 2),
+    PRIMARY KEY (id), FOREIGN KEY(family_id) REFERENCES family (id)
+);
+CREATE UNIQUE INDEX ix_user_phone_number ON "user" (phone_number);
+CREATE TABLE familyrequest (
+    id SERIAL NOT NULL, user_id INTEGER NOT NULL, family_id INTEGER NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, status requeststatus NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "user" (id), FOREIGN KEY(family_id) REFERENCES family (id)
+);
+CREATE TABLE loan (
+    id SERIAL NOT NULL, amount NUMERIC(10, 2), interest_rate NUMERIC(5, 2), total_to_pay NUMERIC(10, 2),
+    description VARCHAR NOT NULL, created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    due_date TIMESTAMP WITHOUT TIME ZONE, status loanstatus NOT NULL,
+    borrower_id INTEGER NOT NULL, lender_id INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(borrower_id) REFERENCES "user" (id), FOREIGN KEY(lender_id) REFERENCES "user" (id)
+);
+CREATE TABLE task (
+    id SERIAL NOT NULL, title VARCHAR NOT NULL, description VARCHAR, reward NUMERIC(10, 2),
+    status taskstatus NOT NULL, created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    child_id INTEGER NOT NULL, creator_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(child_id) REFERENCES "user" (id)
+);
+"""
+
+BASELINE_DATA = """
+INSERT INTO family (id, name, invite_code) VALUES (1, 'Старковы', 'abc123');
+INSERT INTO "user" (id, phone_number, hashed_password, surname, name, paternity, age, role, family_id, balance) VALUES
+    (1, '+996555111111', 'x', 'Старк', 'Нед', 'Рикардович', 40, 'PARENT', 1, 9985.00),
+    (2, '+996555222222', 'x', 'Старк', 'Арья', 'Эддардовна', 11, 'CHILD', 1, 15.00);
+INSERT INTO task (id, title, reward, status, created_at, child_id, creator_id) VALUES
+    (1, 'Уборка', 5.00, 'DONE', '2024-05-01 10:00', 2, 1);
+INSERT INTO loan (id, amount, interest_rate, total_to_pay, description, created_at, status, borrower_id, lender_id) VALUES
+    (1, 100.00, 10.00, 110.00, 'Велосипед', '2024-05-01 11:00', 'PAID', 2, 1);
+INSERT INTO "transaction" (id, amount, description, timestamp, sender_id, receiver_id) VALUES
+    (1, 5.00, 'Payment for task: Уборка', '2024-05-01 12:00', 1, 2),
+    (2, 100.00, 'Loan issued: Велосипед', '2024-05-01 12:00', 1, 2),
+    (3, 110.00, 'Loan repaid: Велосипед', '2024-05-02 12:00', 2, 1);
+"""
+
+
+async def _execute_script(conn, script: str):
+    for statement in script.split(";"):
+        if statement.strip():
+            await conn.execute(text(statement))
+
+
+async def _upgrade_baseline(url):
+    engine = create_async_engine(url)
+    try:
+        async with engine.begin() as conn:
+            await _execute_script(conn, BASELINE_SCHEMA)
+            await _execute_script(conn, BASELINE_DATA)
+
+        await prepare_schema(engine)
+
+        async with engine.connect() as conn:
+            applied = (await conn.execute(text("SELECT name FROM schema_migration"))).scalars().all()
+            relkind = (await conn.execute(text("SELECT relkind::text FROM pg_class WHERE oid = '\"transaction\"'::regclass"))).scalar()
+            family_ids = (await conn.execute(text('SELECT DISTINCT family_id FROM "transaction"'))).scalars().all()
+            interest = (await conn.execute(text("SELECT loan_interest FROM dailyrollup WHERE user_id = 2 AND day = '2024-05-02'"))).scalar()
+            drift = (await conn.execute(text(rollups.RECONCILE_SQL))).all()
+        # Повторный старт ничего не делает
+        await prepare_schema(engine)
+        return applied, relkind, family_ids, interest, drift
+    finally:
+        await engine.dispose()
+
+
+async def _admin(url, statement: str):
+    engine = create_async_engine(url, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text(statement))
+    finally:
+        await engine.dispose()
+
+
+def test_upgrade_from_baseline_schema():
+    server = make_url(DATABASE_URL)
+    database = f"migration_check_{uuid.uuid4().hex[:8]}"
+    try:
+        asyncio.run(_admin(server, f'CREATE DATABASE "{database}"'))
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Postgres недоступен: {e}")
+
+    try:
+        applied, relkind, family_ids, interest, drift = asyncio.run(_upgrade_baseline(server.set(database=database)))
+    finally:
+        asyncio.run(_admin(server, f'DROP DATABASE "{database}"'))
+
+    assert sorted(applied) == sorted(name for name, _ in MIGRATIONS)
+    assert relkind == "p"
+    assert family_ids == [1]
+    assert interest == Decimal("10.00")
+    assert drift == []
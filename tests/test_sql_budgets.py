@@ -0,0 +1,156 @@
+# tests/test_sql_budgets.py
+# Гоняет эндпоинты из SQL_BUDGETS на живом Postgres (DATABASE_URL) с
+# SQL_BUDGET_MODE=raise: лишний запрос или N+1 роняет тест.
+#
+#   DATABASE_URL=postgresql+asyncpg://... python -m pytest -q tests
+#
+# Без доступной базы тесты пропускаются.
+import os
+import uuid
+
+os.environ["SQL_BUDGET_MODE"] = "raise"
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+os.environ.setdefault("SQL_ECHO", "0")
+os.environ.setdefault("ONBOARDING_API_KEY", "test-onboarding-key")
+os.environ.setdefault("JOBS_API_KEY", "test-jobs-key")
+
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from app.core import sqlstats
+from app.main import app
+
+PASSWORD = "secret123"
+LOAN_TERMS = {"interest_rate": "10", "due_date": "2030-01-01T00:00:00"}
+
+hit = set()
+
+
+def _phone() -> str:
+    return "55" + str(uuid.uuid4().int)[:7]
+
+
+def _member(**extra) -> dict:
+    return {"phone_number": _phone(), "surname": "Тестов", "name": "Тест", "paternity": "Тестович",
+            "password": PASSWORD, **extra}
+
+
+def call(client: TestClient, method: str, url: str, endpoint: str, **kwargs):
+    # В режиме raise превышение бюджета роняет запрос само, а по заголовку
+    # проверяем ещё раз - на случай, если MODE переопределён
+    response = client.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    statements = int(response.headers["x-db-statements"])
+    assert statements <= sqlstats.SQL_BUDGETS[endpoint], f"{endpoint}: {statements} statements"
+    hit.add(endpoint)
+    return response
+
+
+@pytest.fixture(scope="module")
+def client():
+    sqlstats.MODE = "raise"
+    try:
+        with TestClient(app) as client:
+            yield client
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Postgres недоступен: {e}")
+
+
+@pytest.fixture(scope="module")
+def family(client):
+    parent = _member(age=40)
+    call(client, "POST", "/auth/register", "POST /auth/register",
+         json={**parent, "role": "parent", "family_name": "Тестовы"})
+    parent_headers = _login(client, "+996" + parent["phone_number"])
+
+    child = _member(age=10)
+    call(client, "POST", "/families/add-child", "POST /families/add-child", json=child, headers=parent_headers)
+    child_headers = _login(client, "+996" + child["phone_number"])
+
+    members = call(client, "GET", "/users/family", "GET /users/family", headers=parent_headers).json()
+    child_id = next(m["id"] for m in members if m["role"] == "child")
+    return {"parent": parent_headers, "child": child_headers, "child_id": child_id}
+
+
+def _login(client: TestClient, phone: str) -> dict:
+    response = call(client, "POST", "/auth/login", "POST /auth/login", data={"username": phone, "password": PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_users_and_families(client, family):
+    call(client, "GET", "/users/me", "GET /users/me", headers=family["parent"])
+    call(client, "GET", "/families/me", "GET /families/me", headers=family["parent"])
+
+
+def test_task_lifecycle(client, family):
+    parent, child = family["parent"], family["child"]
+    task = call(client, "POST", "/tasks/", "POST /tasks/", headers=parent,
+                json={"title": "Уборка", "description": "Пропылесосить", "reward": "5", "child_id": family["child_id"]}).json()
+
+    call(client, "POST", f"/tasks/{task['id']}/submit", "POST /tasks/{task_id}/submit", headers=child)
+    call(client, "POST", f"/tasks/{task['id']}/reject", "POST /tasks/{task_id}/reject", headers=parent)
+    call(client, "POST", f"/tasks/{task['id']}/submit", "POST /tasks/{task_id}/submit", headers=child)
+    call(client, "POST", f"/tasks/{task['id']}/approve", "POST /tasks/{task_id}/approve", headers=parent)
+
+    call(client, "GET", "/tasks/", "GET /tasks/", headers=parent)
+    call(client, "GET", "/tasks/counts", "GET /tasks/counts", headers=parent)
+
+
+def test_loan_lifecycle(client, family):
+    parent, child = family["parent"], family["child"]
+    loan = call(client, "POST", "/loans/", "POST /loans/", headers=child, json={"amount": "3", "description": "Книга"}).json()
+    call(client, "POST", f"/loans/{loan['id']}/approve", "POST /loans/{loan_id}/approve", headers=parent, json=LOAN_TERMS)
+    call(client, "POST", f"/loans/{loan['id']}/repay", "POST /loans/{loan_id}/repay", headers=child)
+
+    loan = call(client, "POST", "/loans/", "POST /loans/", headers=child, json={"amount": "3", "description": "Игра"}).json()
+    call(client, "POST", f"/loans/{loan['id']}/reject", "POST /loans/{loan_id}/reject", headers=parent)
+
+    call(client, "GET", "/loans/", "GET /loans/", headers=parent)
+    call(client, "GET", "/loans/counts", "GET /loans/counts", headers=parent)
+
+
+def test_idempotent_approve(client, family):
+    # Резервирование ключа - тоже запрос, бюджет его уже учитывает
+    loan = call(client, "POST", "/loans/", "POST /loans/", headers=family["child"], json={"amount": "2", "description": "Мяч"}).json()
+    headers = {**family["parent"], "Idempotency-Key": str(uuid.uuid4())}
+    first = call(client, "POST", f"/loans/{loan['id']}/approve", "POST /loans/{loan_id}/approve", headers=headers, json=LOAN_TERMS)
+    replay = call(client, "POST", f"/loans/{loan['id']}/approve", "POST /loans/{loan_id}/approve", headers=headers, json=LOAN_TERMS)
+    assert replay.headers.get("idempotent-replayed") == "true"
+    assert replay.json() == first.json()
+
+
+def test_analytics_and_exports(client, family):
+    call(client, "GET", f"/analytics/children/{family['child_id']}", "GET /analytics/children/{child_id}", headers=family["parent"])
+    call(client, "GET", "/exports/transactions", "GET /exports/transactions", headers=family["parent"])
+
+
+def test_jobs(client, family):
+    job = call(client, "POST", "/jobs/payouts", "POST /jobs/payouts", headers=family["parent"],
+               json={"payouts": [{"child_id": family["child_id"], "amount": "1", "description": "Карманные"}]}).json()
+    call(client, "GET", f"/jobs/payouts/{job['id']}", "GET /jobs/payouts/{job_id}", headers=family["parent"])
+
+    api_key = {"X-API-Key": os.environ["JOBS_API_KEY"]}
+    job = call(client, "POST", "/jobs/", "POST /jobs/", headers=api_key,
+               json={"type": "reconcile_rollups", "delay": 3600}).json()
+    call(client, "GET", f"/jobs/{job['id']}", "GET /jobs/{job_id}", headers=api_key)
+
+
+def test_onboarding(client):
+    family = {"family_name": "Онбординговы", "parents": [_member(age=35)], "children": [_member(age=8), _member(age=12)]}
+    call(client, "POST", "/onboarding/family", "POST /onboarding/family", json=family)
+
+    batch = [{"family_name": f"Школьные {i}", "parents": [_member(age=40)], "children": [_member(age=9)]} for i in range(3)]
+    call(client, "POST", "/onboarding/batch", "POST /onboarding/batch",
+         headers={"X-API-Key": os.environ["ONBOARDING_API_KEY"]}, json={"families": batch})
+
+
+def test_budgets_cover_real_routes():
+    # Переименованный маршрут иначе молча выпадает из проверки
+    routes = {f"{method} {route.path}" for route in app.routes if isinstance(route, APIRoute) for method in route.methods}
+    assert set(sqlstats.SQL_BUDGETS) <= routes, set(sqlstats.SQL_BUDGETS) - routes
+
+
+def test_every_budget_exercised(client):
+    # Последним в модуле: новый бюджет без теста сюда не попадёт
+    assert set(sqlstats.SQL_BUDGETS) <= hit, set(sqlstats.SQL_BUDGETS) - hit